@@ -21,13 +21,20 @@ def run():
     config_must_have = {
         "host": str,
         "port": int,
-        "timeout": float
+        "timeout": float,
+        "keepalive_interval": float,
+        "heartbeat_interval": float,
+        "reconnect_attempts": int,
+        "reconnect_delay": float,
+        "reconnect_max_delay": float,
+        "catalogue_path": str
     }
     config = open_config("client/cfg/client_config.json")
     if config is None or not transform_config(config, config_must_have):
         return
 
-    ClientCore(Proxy(ServerHandler(**config)), TUI()).exec()
+    catalogue_path = config.pop("catalogue_path")
+    ClientCore(Proxy(ServerHandler(**config), catalogue_path), TUI()).exec()
 
 
 if __name__ == "__main__":
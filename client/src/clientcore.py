@@ -37,6 +37,7 @@ class ClientCore:
         self._ui.set_server(self._server)
         self._state = ClientCore._State.CONNECTING
         self._user_name = None
+        self._token = None
         self._last_command = None
         self._last_result = None
 
@@ -56,6 +57,9 @@ class ClientCore:
 
         On each iteration object checks user events,
         send them to server and process answear.
+        If connection is lost, client reconnects and resumes session
+        by itself, or logs in again, if session has expired.
+        User is asked only if server can't be reached.
         """
         self._ui.greet()
         while self._state is not ClientCore._State.DISCONNECTING:
@@ -63,16 +67,26 @@ class ClientCore:
                 self._states[self._state]()
             except SystemExit:
                 self._state = ClientCore._State.DISCONNECTING
-            except (EOFError, ConnectionError):
+            except EOFError:
                 self._state = ClientCore._State.ASKING_RECONNECT
+            except ConnectionError:
+                if self._state is ClientCore._State.CONNECTING:
+                    self._state = ClientCore._State.ASKING_RECONNECT
+                else:
+                    self._state = ClientCore._State.CONNECTING
         self._ui.farewell()
 
     def _connect(self):
         # both
         self._ui.say_wait_for_connection()
         self._server.reconnect()
-        self._server.execute(Request.Type.PING)
         self._ui.say_got_connection()
+        if self._token:
+            response = self._server.execute(Request.Type.RESUME, self._token)
+            if response.success:
+                self._state = ClientCore._State.GETTING_COMMAND
+                return
+            self._token = None
         if self._user_name:
             self._state = ClientCore._State.LOGGINIG_IN
         else:
@@ -95,6 +109,7 @@ class ClientCore:
         response = self._server.execute(Request.Type.LOG_IN, self._user_name)
         self._ui.show_result(response)
         if response.success:
+            self._token = response.data
             self._state = ClientCore._State.GETTING_COMMAND
         else:
             self._state = ClientCore._State.ASKING_NAME
@@ -123,4 +138,5 @@ class ClientCore:
     def _log_out(self):
         # both
         self._server.execute(Request.Type.LOG_OUT)
+        self._token = None
         self._state = ClientCore._State.ASKING_NAME
@@ -0,0 +1,69 @@
+"""Benchmark of codecs.
+
+Measures size of typical messages and time of their encoding
+and decoding with BinaryCodec and, for comparison, with pickle,
+which was used on the wire before.
+"""
+
+import addshare
+from pickle import dumps, loads
+from timeit import repeat
+from codec import BinaryCodec
+from request import Request, Response
+from item import Item
+from user import User
+
+
+def sample_messages():
+    """Get list of names and typical messages, requests and responses."""
+    items = [Item(f"item{n}", n, n//2) for n in range(100)]
+    user = User("Jon")
+    user.credits = 100
+    user.items.update({"hat": 1, "dragon": 2})
+    return [
+        ("PURCHASE_ITEM request",
+         Request(Request.Type.PURCHASE_ITEM, ("hat", 2))),
+        ("GET_CREDITS response",
+         Response(Request.Type.GET_CREDITS, data=120)),
+        ("GET_CURRENT_USER response",
+         Response(Request.Type.GET_CURRENT_USER, data=user)),
+        ("GET_ALL_ITEMS(100) response",
+         Response(Request.Type.GET_ALL_ITEMS, data=items)),
+    ]
+
+
+def measure(function, size):
+    """Get best time of single call in microseconds.
+
+    Number of calls is chosen by size of message,
+    so each measurement takes about the same time.
+    """
+    number = max(20000000//max(size, 100)//100, 100)
+    return min(repeat(function, number=number, repeat=5))/number*1000000
+
+
+def run():
+    """Print size, encoding and decoding time of each message."""
+    codec = BinaryCodec()
+    print(
+        f"{'message':<28}{'binary B':>9}{'enc us':>8}{'dec us':>8}"
+        f"{'pickle B':>10}{'enc us':>8}{'dec us':>8}"
+    )
+    for name, message in sample_messages():
+        if isinstance(message, Response):
+            encode, decode = codec.encode_response, codec.decode_response
+        else:
+            encode, decode = codec.encode_request, codec.decode_request
+        data, pickled = encode(message), dumps(message)
+        print(
+            f"{name:<28}{len(data):>9}"
+            f"{measure(lambda: encode(message), len(data)):>8.1f}"
+            f"{measure(lambda: decode(data), len(data)):>8.1f}"
+            f"{len(pickled):>10}"
+            f"{measure(lambda: dumps(message), len(data)):>8.1f}"
+            f"{measure(lambda: loads(pickled), len(data)):>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    run()
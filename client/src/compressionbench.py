@@ -0,0 +1,109 @@
+"""Benchmark of compression.
+
+Measures size of typical messages and time of their encoding
+and decoding without compression, with plain zlib and with zlib,
+primed with catalogue dictionary, for catalogues of different size.
+"""
+
+import addshare
+from random import Random
+from zlib import compress
+from codec import DEFAULT_CODEC
+from compression import CompressedCodec, build_zdict
+from request import Request, Response
+from item import Item
+from user import User
+from codecbench import measure
+
+CATALOGUE_SIZES = (10, 100, 1000, 10000)
+
+_ADJECTIVES = ("old new small big rusty shiny cursed blessed golden wooden "
+               "iron silver broken ancient heavy light").split()
+_NOUNS = ("hat shirt pants boots shovel sword shield ring amulet dragon "
+          "mountain clover axe bow helmet cloak").split()
+
+
+def catalogue(random, size):
+    """Get list of given number of items with made up names."""
+    return [
+        Item(
+            f"{random.choice(_ADJECTIVES)} {random.choice(_NOUNS)} {n}",
+            random.randint(10, 1000),
+            random.randint(1, 500)
+        )
+        for n in range(size)
+    ]
+
+
+def sample_messages(random, items):
+    """Get list of names and typical responses for given catalogue."""
+    users = []
+    for n in range(100):
+        user = User(f"user{n:05d}")
+        user.credits = random.randint(0, 100000)
+        for item in random.sample(items, min(10, len(items))):
+            user.items[item.name] = random.randint(1, 20)
+        users.append(user)
+    return [
+        ("GET_ALL_ITEMS", Response(
+            Request.Type.GET_ALL_ITEMS, data=items, request_id=1
+        )),
+        ("GET_USER_ITEMS", Response(
+            Request.Type.GET_USER_ITEMS,
+            data={item.name: item
+                  for item in random.sample(items, min(20, len(items)))},
+            request_id=1
+        )),
+        ("GET_USERS_PAGE(100)", Response(
+            Request.Type.GET_USERS_PAGE,
+            data=(users, users[-1].name),
+            request_id=1
+        )),
+        ("NOTIFY(10 items)", Response(
+            Request.Type.NOTIFY,
+            data=(7, [], random.sample(items, min(10, len(items))), [])
+        )),
+    ]
+
+
+def run():
+    """Print sizes, encoding and decoding times of each message.
+
+    Each column has three values: without compression,
+    with plain zlib and with zlib and dictionary.
+    """
+    random = Random(1)
+    print(f"{'items':>6}  {'message':<20}{'bytes':>28}"
+          f"{'encode us':>24}{'decode us':>24}")
+    for size in CATALOGUE_SIZES:
+        items = catalogue(random, size)
+        zdict = build_zdict([DEFAULT_CODEC.encode_response(
+            Response(Request.Type.GET_ALL_ITEMS, data=items)
+        )])
+        codecs = (
+            DEFAULT_CODEC,
+            CompressedCodec(DEFAULT_CODEC, 0),
+            CompressedCodec(DEFAULT_CODEC, 0, zdict)
+        )
+        print(f"{size:>6}  dictionary transfer {len(compress(zdict, 9))} B")
+        for name, response in sample_messages(random, items):
+            encoded = [codec.encode_response(response) for codec in codecs]
+            raw_size = len(encoded[0])
+            encode = [
+                measure(lambda: codec.encode_response(response), raw_size)
+                for codec in codecs
+            ]
+            decode = [
+                measure(lambda: codec.decode_response(data), raw_size)
+                for codec, data in zip(codecs, encoded)
+            ]
+            print(
+                f"{size:>6}  {name:<20}"
+                f"{' / '.join(str(len(data)) for data in encoded):>28}"
+                f"{' / '.join(f'{time:.0f}' for time in encode):>24}"
+                f"{' / '.join(f'{time:.0f}' for time in decode):>24}"
+            )
+
+
+if __name__ == "__main__":
+    run()
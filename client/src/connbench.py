@@ -0,0 +1,139 @@
+"""Benchmark of many connections.
+
+Headless client, which opens many idle connections to server,
+then sends PING over all of them at once and waits for all answers.
+It shows how server engine copes with number of clients.
+"""
+
+import addshare
+import socket
+from sys import stderr
+from time import perf_counter, sleep
+from request import Request
+from codec import DEFAULT_CODEC
+from transport import FramedSocket
+from confighandler import open_config, transform_config
+
+try:
+    from resource import getrlimit, setrlimit, RLIMIT_NOFILE
+except ImportError:
+    RLIMIT_NOFILE = None
+
+
+def raise_open_files_limit():
+    """Allow process to open as many sockets, as system lets it."""
+    if RLIMIT_NOFILE is not None:
+        hard = getrlimit(RLIMIT_NOFILE)[1]
+        setrlimit(RLIMIT_NOFILE, (hard, hard))
+
+
+def process_status(pid):
+    """Get number of threads and resident memory in MiB of process.
+
+    Status is read from /proc, so None is returned on systems
+    without it, or if pid is 0.
+    """
+    if not pid:
+        return None
+    try:
+        with open(f"/proc/{pid}/status", "r") as status_stream:
+            status = dict(
+                line.split(":", 1) for line in status_stream if ":" in line
+            )
+    except OSError:
+        return None
+    return int(status["Threads"]), int(status["VmRSS"].split()[0])//1024
+
+
+class ConnectionsBenchmark:
+    """Holds connections idle and pings over all of them."""
+
+    def __init__(self, host, port, timeout, connections, server_pid):
+        """Create benchmark.
+
+        connections is number of connections to open.
+        server_pid is id of server process on the same machine,
+        whose threads and memory are reported. 0 disables it.
+        """
+        self._address = host, port
+        self._timeout = timeout
+        self._connections = connections
+        self._server_pid = server_pid
+
+    def run(self):
+        """Run benchmark and return its report."""
+        before = process_status(self._server_pid)
+        channels = []
+        try:
+            start = perf_counter()
+            for _ in range(self._connections):
+                channels.append(FramedSocket(
+                    socket.create_connection(self._address, self._timeout),
+                    64
+                ))
+            connect_time = perf_counter() - start
+            sleep(1)
+            idle = process_status(self._server_pid)
+
+            ping = DEFAULT_CODEC.encode_request(Request(Request.Type.PING))
+            start = perf_counter()
+            for channel in channels:
+                channel.send(ping)
+            for channel in channels:
+                if channel.recv() is None:
+                    raise ConnectionError("Server closed connection")
+            ping_time = perf_counter() - start
+        finally:
+            for channel in channels:
+                channel.socket.close()
+
+        report = {
+            "connections": self._connections,
+            "connect": connect_time,
+            "ping_all": ping_time,
+        }
+        if before and idle:
+            report["server_threads"] = idle[0]
+            report["server_memory"] = idle[1] - before[1]
+        return report
+
+
+def print_report(report):
+    """Print report in one line."""
+    line = (
+        f"{report['connections']} connections: "
+        f"connect {1000*report['connect']:.0f} ms, "
+        f"ping all {1000*report['ping_all']:.0f} ms"
+    )
+    if "server_threads" in report:
+        line += (
+            f", server has {report['server_threads']} threads, "
+            f"+{report['server_memory']} MiB"
+        )
+    print(line)
+
+
+def run():
+    """Run connections benchmark."""
+    config_must_have = {
+        "host": str,
+        "port": int,
+        "timeout": float,
+        "connections": int,
+        "server_pid": int
+    }
+    config = open_config("client/cfg/connbench_config.json")
+    if config is None or not transform_config(config, config_must_have):
+        return
+
+    raise_open_files_limit()
+    try:
+        report = ConnectionsBenchmark(**config).run()
+    except (ConnectionError, OSError) as error:
+        print("Benchmark failed:", error, file=stderr)
+        return
+    print_report(report)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,301 @@
+"""Load generator.
+
+Headless client, which runs many virtual users against server
+and measures throughput and latency of requests.
+"""
+
+import addshare
+from json import dump as dump_json, load as load_json
+from random import Random
+from sys import stderr
+from threading import Thread, Lock
+from time import perf_counter, sleep, strftime
+from request import Request
+from serverhandler import ServerHandler
+from proxy import Proxy
+from confighandler import open_config, transform_config
+
+
+class _Stats:
+    """Thread-safe storage of latencies and results per request type."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._latencies = {}
+        self._failed = {}
+        self._errors = {}
+
+    def add(self, request_type, latency, success):
+        """Add result of single request."""
+        with self._lock:
+            self._latencies.setdefault(request_type, []).append(latency)
+            if not success:
+                self._failed[request_type] = \
+                    self._failed.get(request_type, 0) + 1
+
+    def add_error(self, request_type):
+        """Add request, which failed with connection error."""
+        with self._lock:
+            self._errors[request_type] = self._errors.get(request_type, 0) + 1
+
+    @staticmethod
+    def _percentile(ordered, percent):
+        index = max(int(len(ordered)*percent/100 + 0.5) - 1, 0)
+        return ordered[min(index, len(ordered) - 1)]
+
+    def report(self, duration):
+        """Get dict with summary per request type name.
+
+        Latencies are in milliseconds, throughput in requests per second.
+        """
+        ret = {}
+        with self._lock:
+            names = set(self._latencies) | set(self._errors)
+            for request_type in sorted(names, key=lambda t: t.value):
+                latencies = sorted(self._latencies.get(request_type, [0.0]))
+                count = len(self._latencies.get(request_type, []))
+                ret[request_type.name] = {
+                    "count": count,
+                    "failed": self._failed.get(request_type, 0),
+                    "errors": self._errors.get(request_type, 0),
+                    "throughput": count/duration,
+                    "mean": 1000*sum(latencies)/len(latencies),
+                    "p50": 1000*self._percentile(latencies, 50),
+                    "p95": 1000*self._percentile(latencies, 95),
+                    "p99": 1000*self._percentile(latencies, 99),
+                }
+        return ret
+
+
+class LoadGenerator:
+    """Runs virtual users, each in its own thread and connection.
+
+    Each virtual user logs in under its own name, then sends requests,
+    randomly chosen according to weights in mix, until time is up.
+    After LOG_OUT it logs in again with next request.
+    Only request types, listed in REQUEST_TYPES, can be used in mix.
+    """
+
+    REQUEST_TYPES = {
+        Request.Type.GET_ALL_ITEMS,
+        Request.Type.PURCHASE_ITEM,
+        Request.Type.SELL_ITEM,
+        Request.Type.LOG_OUT,
+    }
+
+    def __init__(self, host, port, timeout,
+                 virtual_users, duration, think_time, mix, use_proxy,
+                 seed=None):
+        """Create load generator.
+
+        virtual_users is number of simultanious clients.
+        duration is time of test in seconds.
+        think_time is pause in seconds after each request.
+        mix is a dict of request types names and their weights.
+        If use_proxy is set, requests go through Proxy, like in client.
+        Raise ValueError if mix is invalid.
+        """
+        self._address = host, port, timeout
+        self._virtual_users = virtual_users
+        self._duration = duration
+        self._think_time = think_time
+        self._use_proxy = use_proxy
+        self._seed = seed
+
+        try:
+            self._mix = {Request.Type[name]: mix[name] for name in mix}
+        except KeyError as error:
+            raise ValueError(f"Unknown request type: {error}")
+        if not set(self._mix) <= self.REQUEST_TYPES:
+            raise ValueError("Unsupported request type in mix")
+        if sum(self._mix.values()) <= 0:
+            raise ValueError("Mix is empty")
+
+        self._stats = _Stats()
+        self._deadline = None
+
+    def run(self):
+        """Run test and return its report."""
+        self._deadline = perf_counter() + self._duration
+        threads = [
+            Thread(target=self._run_user, args=(number,), daemon=True)
+            for number in range(self._virtual_users)
+        ]
+        start = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = perf_counter() - start
+
+        report = self._stats.report(duration)
+        return {
+            "time": strftime("%Y-%m-%d %H:%M:%S"),
+            "virtual_users": self._virtual_users,
+            "duration": duration,
+            "think_time": self._think_time,
+            "use_proxy": self._use_proxy,
+            "mix": {key.name: value for key, value in self._mix.items()},
+            "throughput": sum(r["count"] for r in report.values())/duration,
+            "requests": report,
+        }
+
+    def _connect(self):
+        server = ServerHandler(*self._address)
+        if self._use_proxy:
+            server = Proxy(server)
+        server.reconnect()
+        return server
+
+    def _run_user(self, number):
+        random = Random(None if self._seed is None else self._seed + number)
+        user_name = f"loadgen{number}"
+        types, weights = list(self._mix), list(self._mix.values())
+        owned = {}
+        items_names = []
+        server = None
+        logged_in = False
+
+        while perf_counter() < self._deadline:
+            request_type, arg = Request.Type.LOG_IN, user_name
+            try:
+                if server is None:
+                    server, logged_in = self._connect(), False
+                    items_names = server.execute(
+                        Request.Type.GET_ALL_ITEMS_NAMES
+                    ).data
+                if logged_in:
+                    request_type = random.choices(types, weights)[0]
+                    arg = self._get_arg(random, request_type,
+                                        items_names, owned)
+                response = self._execute(server, request_type, arg)
+                if request_type is Request.Type.LOG_IN and response.success:
+                    owned = dict(server.execute(
+                        Request.Type.GET_CURRENT_USER
+                    ).data.items)
+            except (ConnectionError, OSError):
+                self._stats.add_error(request_type)
+                server = None
+                continue
+
+            if request_type is Request.Type.LOG_IN:
+                logged_in = response.success
+            elif request_type is Request.Type.LOG_OUT:
+                logged_in = not response.success
+            elif response.success:
+                self._update_owned(request_type, arg, owned)
+            if self._think_time:
+                sleep(self._think_time)
+
+        if server is not None and logged_in:
+            try:
+                server.execute(Request.Type.LOG_OUT)
+            except (ConnectionError, OSError):
+                pass
+
+    @staticmethod
+    def _get_arg(random, request_type, items_names, owned):
+        if request_type is Request.Type.PURCHASE_ITEM:
+            return random.choice(items_names), 1
+        if request_type is Request.Type.SELL_ITEM:
+            if owned:
+                return random.choice(list(owned)), 1
+            return random.choice(items_names), 1
+        return None
+
+    @staticmethod
+    def _update_owned(request_type, arg, owned):
+        if request_type is Request.Type.PURCHASE_ITEM:
+            item_name, amount = arg
+            owned[item_name] = owned.get(item_name, 0) + amount
+        elif request_type is Request.Type.SELL_ITEM:
+            item_name, amount = arg
+            left = owned.get(item_name, 0) - amount
+            if left > 0:
+                owned[item_name] = left
+            else:
+                owned.pop(item_name, None)
+
+    def _execute(self, server, request_type, arg):
+        start = perf_counter()
+        response = server.execute(request_type, arg)
+        self._stats.add(request_type, perf_counter() - start, response.success)
+        return response
+
+
+def print_report(report, baseline=None):
+    """Print report as table.
+
+    If baseline report is given, print change of throughput
+    and p95 latency for each request type.
+    """
+    print(
+        f"{report['virtual_users']} virtual users, "
+        f"{report['duration']:.1f} s, "
+        f"{report['throughput']:.0f} requests/s"
+    )
+    print(
+        f"{'request':<16}{'count':>9}{'failed':>8}{'errors':>8}"
+        f"{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    )
+    for name, row in report["requests"].items():
+        line = (
+            f"{name:<16}{row['count']:>9}{row['failed']:>8}"
+            f"{row['errors']:>8}{row['throughput']:>10.0f}"
+            f"{row['p50']:>9.2f}{row['p95']:>9.2f}{row['p99']:>9.2f}"
+        )
+        old = (baseline or {}).get("requests", {}).get(name)
+        if old and old["throughput"] and old["p95"]:
+            line += (
+                f"  req/s {row['throughput']/old['throughput'] - 1:+.0%}"
+                f"  p95 {row['p95']/old['p95'] - 1:+.0%}"
+            )
+        print(line)
+
+
+def run():
+    """Run load test and save its results."""
+    config_must_have = {
+        "host": str,
+        "port": int,
+        "timeout": float,
+        "virtual_users": int,
+        "duration": float,
+        "think_time": float,
+        "mix": dict,
+        "use_proxy": bool,
+        "results_path": str,
+        "baseline_path": str
+    }
+    config = open_config("client/cfg/loadgen_config.json")
+    if config is None or not transform_config(config, config_must_have):
+        return
+    results_path = config.pop("results_path")
+    baseline_path = config.pop("baseline_path")
+
+    baseline = None
+    if baseline_path:
+        try:
+            with open(baseline_path, "r") as baseline_stream:
+                baseline = load_json(baseline_stream)
+        except (OSError, ValueError):
+            print("Can't read baseline", file=stderr)
+
+    try:
+        generator = LoadGenerator(**config)
+    except ValueError as error:
+        print(error, file=stderr)
+        return
+    report = generator.run()
+    print_report(report, baseline)
+
+    if results_path:
+        try:
+            with open(results_path, "w") as results_stream:
+                dump_json(report, results_stream, indent=4)
+        except OSError:
+            print("Can't save results", file=stderr)
+
+
+if __name__ == "__main__":
+    run()
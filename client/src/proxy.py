@@ -1,5 +1,9 @@
 """Moduel contains Proxy class."""
 
+from json import dump, load
+from os import makedirs, replace
+from os.path import dirname
+from item import Item
 from request import Request, Response
 
 
@@ -11,14 +15,25 @@ class Proxy:
     It wraps ServerHandler instance.
     Proxy has cache, which is updated when necessary.
     It is used to provide client with some info without asking server.
+    Proxy subscribes to notifications from server, so cached
+    users and items are kept up to date without refetching them.
+    On reconnect Proxy sends digest of items it has and gets
+    only changes since then. Items can be kept in file,
+    so they are not downloaded again on the next start.
     """
 
-    def __init__(self, server):
+    def __init__(self, server, catalogue_path=""):
         """Create Proxy.
 
         Takes real ServerHandler as argument.
+        catalogue_path is path to file, where items are kept
+        between runs. Empty path disables it.
         """
         self._server = server
+        self._version = 0
+        self._items = {}
+        self._digest = ""
+        self._catalogue_path = catalogue_path
         self._cache = {
             Request.Type.GET_ALL_USERS_NAMES: None,
             Request.Type.GET_ALL_ITEMS: None,
@@ -27,16 +42,22 @@ class Proxy:
             Request.Type.GET_CREDITS: None,
             Request.Type.GET_USER_ITEMS_NAMES: None
         }
+        self._handlers = {
+            Request.Type.LOG_IN: self._log_in,
+            Request.Type.RESUME: self._log_in,
+            Request.Type.PURCHASE_ITEMS: self._trade_items,
+            Request.Type.SELL_ITEMS: self._trade_items,
+            Request.Type.PURCHASE_ITEM: self._trade_item,
+            Request.Type.SELL_ITEM: self._trade_item,
+        }
         self._updaters = {
-            Request.Type.LOG_IN: self._get_user_info,
             Request.Type.LOG_OUT: self._clear_user_info,
-            Request.Type.PURCHASE_ITEM: self._handle_purchase,
-            Request.Type.SELL_ITEM: self._handle_sale
         }
         self._checkers = {
             Request.Type.ITEM_EXISTS: self._item_exists,
             Request.Type.GET_ITEM: self._get_item,
         }
+        self._load_catalogue()
 
     def reconnect(self):
         """Wrapps ServerHandler.reconnect."""
@@ -48,7 +69,10 @@ class Proxy:
 
         Update cache and use it to provide responses when possible.
         """
-        if request_type in self._updaters:
+        self._apply_notifications()
+        if request_type in self._handlers:
+            ret = self._handlers[request_type](request_type, arg)
+        elif request_type in self._updaters:
             ret = self._server.execute(request_type, arg)
             if ret.success:
                 self._updaters[request_type](arg)
@@ -63,37 +87,131 @@ class Proxy:
     def _item_exists(self, item_name):
         return Response(
             Request.Type.ITEM_EXISTS,
-            data=(item_name in self._cache[Request.Type.GET_ALL_ITEMS_NAMES])
+            data=(item_name in self._items)
         )
 
     def _get_item(self, item_name):
-        if item_name not in self._cache[Request.Type.GET_ALL_ITEMS_NAMES]:
+        if item_name not in self._items:
             ret = Response(
                 Request.Type.GET_ITEM,
                 success=False,
                 message=f"No such item: {item_name}"
             )
         else:
-            item = next(filter(
-                lambda item: item.name == item_name,
-                self._cache[Request.Type.GET_ALL_ITEMS]
-                ))
             ret = Response(
                 Request.Type.GET_ITEM,
-                data=item
+                data=self._items[item_name]
             )
         return ret
 
+    def _set_items(self, items):
+        self._items = {item.name: item for item in items}
+        self._cache[Request.Type.GET_ALL_ITEMS] = list(self._items.values())
+        self._cache[Request.Type.GET_ALL_ITEMS_NAMES] = list(self._items)
+
+    def _load_catalogue(self):
+        """Read items, kept in file. Broken or missing file is ignored."""
+        if not self._catalogue_path:
+            return
+        try:
+            with open(self._catalogue_path) as catalogue_file:
+                catalogue = load(catalogue_file)
+            items = [Item(*fields) for fields in catalogue["items"]]
+            digest = catalogue["digest"]
+        except (OSError, ValueError, TypeError, KeyError):
+            return
+        self._set_items(items)
+        self._digest = digest
+
+    def _save_catalogue(self):
+        """Write items into file. Errors are ignored."""
+        if not self._catalogue_path:
+            return
+        catalogue = {
+            "digest": self._digest,
+            "items": [
+                (item.name, item.buying_price, item.selling_price)
+                for item in self._items.values()
+            ]
+        }
+        temp_path = self._catalogue_path + ".tmp"
+        try:
+            makedirs(dirname(self._catalogue_path) or ".", exist_ok=True)
+            with open(temp_path, "w") as catalogue_file:
+                dump(catalogue, catalogue_file)
+            replace(temp_path, self._catalogue_path)
+        except OSError:
+            pass
+
     def _get_game_info(self, *_):
-        self._cache[Request.Type.GET_ALL_USERS_NAMES] = \
-            self._server.execute(Request.Type.GET_ALL_USERS_NAMES).data
-        self._cache[Request.Type.GET_ALL_ITEMS] = \
-            self._server.execute(Request.Type.GET_ALL_ITEMS).data
-        self._cache[Request.Type.GET_ALL_ITEMS_NAMES] = \
-            self._server.execute(Request.Type.GET_ALL_ITEMS_NAMES).data
-
-    def _get_user_info(self, *_):
-        user = self._server.execute(Request.Type.GET_CURRENT_USER).data
+        subscription, users_names, changes = self._server.execute_batch([
+            (Request.Type.SUBSCRIBE, None),
+            (Request.Type.GET_ALL_USERS_NAMES, None),
+            (Request.Type.GET_ITEMS_CHANGES, self._digest)
+        ])
+        self._version = subscription.data or 0
+        self._cache[Request.Type.GET_ALL_USERS_NAMES] = users_names.data
+        digest, full, items, removed_items = changes.data
+        if full:
+            self._set_items(items)
+        else:
+            self._change_items(items, removed_items)
+        if digest != self._digest:
+            self._digest = digest
+            self._save_catalogue()
+
+    def _apply_notifications(self):
+        for notification in self._server.poll_notifications():
+            version, users, items, removed_items = notification.data
+            if version <= self._version:
+                continue
+            if version != self._version + 1:
+                self._get_game_info()
+                continue
+            self._version = version
+            self._apply_changes(users, items, removed_items)
+
+    def _apply_changes(self, users, items, removed_items):
+        users_names = self._cache[Request.Type.GET_ALL_USERS_NAMES]
+        for user_name in users:
+            if user_name not in users_names:
+                users_names.append(user_name)
+        if items or removed_items:
+            # Server gets changes since digest from snapshot with it,
+            # so items, changed by notifications since then,
+            # could be left stale. Catalogue is fetched whole instead.
+            self._digest = ""
+        self._change_items(items, removed_items)
+
+    def _change_items(self, items, removed_items):
+        """Update cached items.
+
+        Digest isn't changed here: it stays valid for changes,
+        got with GET_ITEMS_CHANGES, but not for notifications.
+        """
+        if not items and not removed_items:
+            return
+        all_items = dict(self._items)
+        all_items.update((item.name, item) for item in items)
+        for item_name in removed_items:
+            all_items.pop(item_name, None)
+        self._set_items(all_items.values())
+
+    def _log_in(self, request_type, user_name_or_token):
+        """Log in or resume session and fetch user info in single batch.
+
+        User info is fetched on resume too, since response
+        to the last request before disconnect may have been lost.
+        """
+        log_in, current_user = self._server.execute_batch([
+            (request_type, user_name_or_token),
+            (Request.Type.GET_CURRENT_USER, None)
+        ])
+        if log_in.success:
+            self._set_user_info(current_user.data)
+        return log_in
+
+    def _set_user_info(self, user):
         self._cache[Request.Type.GET_CURRENT_USER_NAME] = user.name
         self._cache[Request.Type.GET_CREDITS] = user.credits
         self._cache[Request.Type.GET_USER_ITEMS_NAMES] = user.items
@@ -108,18 +226,28 @@ class Proxy:
         ]:
             self._cache[request_type] = None
 
-    def _handle_purchase(self, item_name_and_amount):
-        item_name, amount = item_name_and_amount
-        item = self._server.execute(Request.Type.GET_ITEM, item_name).data
-        self._cache[Request.Type.GET_CREDITS] -= item.buying_price*amount
-        self._cache[Request.Type.GET_USER_ITEMS_NAMES][item_name] = \
-            self._cache[Request.Type.GET_USER_ITEMS_NAMES].get(item_name, 0) \
-            + amount
-
-    def _handle_sale(self, item_name_and_amount):
-        item_name, amount = item_name_and_amount
-        item = self._server.execute(Request.Type.GET_ITEM, item_name).data
-        self._cache[Request.Type.GET_CREDITS] += item.selling_price*amount
-        self._cache[Request.Type.GET_USER_ITEMS_NAMES][item_name] -= amount
-        if self._cache[Request.Type.GET_USER_ITEMS_NAMES][item_name] == 0:
-            self._cache[Request.Type.GET_USER_ITEMS_NAMES].pop(item_name)
+    def _trade_items(self, request_type, lines):
+        ret = self._server.execute(request_type, lines)
+        if ret.data is None:
+            return ret
+        credits, results = ret.data
+        self._cache[Request.Type.GET_CREDITS] = credits
+        for (item_name, _), (_, _, amount) in zip(lines, results):
+            self._set_user_item(item_name, amount)
+        return ret
+
+    def _set_user_item(self, item_name, amount):
+        user_items = self._cache[Request.Type.GET_USER_ITEMS_NAMES]
+        if amount:
+            user_items[item_name] = amount
+        else:
+            user_items.pop(item_name, None)
+
+    def _trade_item(self, request_type, item_name_and_amount):
+        ret = self._server.execute(request_type, item_name_and_amount)
+        if ret.success:
+            item_name, _ = item_name_and_amount
+            credits, amount = ret.data
+            self._cache[Request.Type.GET_CREDITS] = credits
+            self._set_user_item(item_name, amount)
+        return ret
@@ -1,48 +1,261 @@
 """Module contains ServerHandler."""
 
 import socket
-from pickle import dumps, loads
+from random import random
+from time import monotonic, sleep
+from zlib import decompress, error as ZlibError
 from request import Request
+from transport import FramedSocket
+from codec import CODECS, DEFAULT_CODEC, choose_codec
+from compression import COMPRESSION, CompressedCodec, zdict_hash
 
 
 class ServerHandler:
     """ServerHandler handles connection with server on client side.
 
     Implements straight send-recieve model.
+    Several requests can be pipelined with execute_many:
+    they are sent at once, and responses are matched by request id.
+    Use execute_batch to send several requests in single frame.
+    Notifications, which server sends without request,
+    are kept until poll_notifications is called.
+
+    Connection is checked in two ways. TCP keepalive lets
+    operating system find out dead connection while client is idle.
+    Heartbeat PING is sent before the first request after long pause,
+    so dead connection is found before request, which changes
+    something, is sent.
+
+    Large messages are compressed, if server enables it.
+    Dictionary for compression is sent by server once
+    and is kept while it stays the same, even after reconnect.
     """
 
-    def __init__(self, host, port, timeout):
+    def __init__(self, host, port, timeout,
+                 keepalive_interval=0, heartbeat_interval=0,
+                 reconnect_attempts=1, reconnect_delay=0,
+                 reconnect_max_delay=0, compression=True):
         """Initialize client.
 
         Later client will try to connect to given server,
         on given port with given timeout(ms).
+        keepalive_interval is time in seconds of silence,
+        after which TCP keepalive probes are sent. 0 disables them.
+        heartbeat_interval is time in seconds of silence,
+        after which request is preceded by PING. 0 disables it.
+        reconnect tries to connect reconnect_attempts times.
+        Delay between attempts starts from reconnect_delay
+        and doubles each time, up to reconnect_max_delay.
+        compression allows server to compress messages.
         """
         self._host, self._port = host, port
         self._socket = None
+        self._channel = None
+        self._codec = DEFAULT_CODEC
         self._timeout = timeout
+        self._keepalive_interval = keepalive_interval
+        self._heartbeat_interval = heartbeat_interval
+        self._reconnect_attempts = max(reconnect_attempts, 1)
+        self._reconnect_delay = reconnect_delay
+        self._reconnect_max_delay = max(reconnect_max_delay, reconnect_delay)
+        self._compression = compression
+        self._zdict = b""
+        self._zdict_hash = ""
+        self._last_response_time = 0.0
+        self._next_id = 0
+        self._responses = {}
+        self._notifications = []
 
     def reconnect(self):
-        """Close connection if open, and try to connect again."""
+        """Close connection if open, and try to connect again.
+
+        Attempts are separated by growing delays with random jitter,
+        so clients don't reconnect all at once after server restart.
+        Negotiate codec and compression with server on success.
+        Raise ConnectionError if all attempts fail.
+        """
+        delay = self._reconnect_delay
+        for attempt in range(self._reconnect_attempts):
+            if attempt:
+                sleep(delay*(0.5 + random()/2))
+                delay = min(2*delay, self._reconnect_max_delay)
+            try:
+                self._connect()
+                return
+            except OSError as error:
+                last_error = error
+        raise ConnectionError(f"Can't connect to server: {last_error}")
+
+    def _connect(self):
         if self._socket:
             self._socket.close()
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._socket.connect((self._host, self._port))
-        self._socket.settimeout(self._timeout)
+            self._socket = None
+        self._socket = socket.create_connection(
+            (self._host, self._port),
+            self._timeout
+        )
+        if self._keepalive_interval:
+            self._set_keepalive(self._socket, self._keepalive_interval)
+        self._channel = FramedSocket(self._socket)
+        self._codec = DEFAULT_CODEC
+        self._responses.clear()
+        self._notifications.clear()
+        options = {"codecs": list(CODECS)}
+        if self._compression:
+            options["compression"] = [COMPRESSION]
+            options["zdict_hash"] = self._zdict_hash
+        response = self._get_response_to(self._send_request(
+            Request.Type.PING,
+            options
+        ))
+        codec = choose_codec([response.data["codec"]])
+        if response.data.get("compression") == COMPRESSION:
+            codec = CompressedCodec(
+                codec,
+                response.data["threshold"],
+                self._get_zdict(response.data)
+            )
+        self._codec = codec
+
+    def _get_zdict(self, options):
+        """Get dictionary, negotiated with server, and keep it.
+
+        Raise ConnectionError if server sent broken one.
+        """
+        if "zdict" in options:
+            try:
+                zdict = decompress(options["zdict"])
+            except ZlibError as error:
+                raise ConnectionError(error) from error
+            if zdict_hash(zdict) != options["zdict_hash"]:
+                raise ConnectionError("Dictionary doesn't match its hash")
+            self._zdict, self._zdict_hash = zdict, options["zdict_hash"]
+        elif options["zdict_hash"] != self._zdict_hash:
+            raise ConnectionError("Server didn't send dictionary")
+        return self._zdict
+
+    @staticmethod
+    def _set_keepalive(sock, interval):
+        """Probe connection after interval of silence.
+
+        Three probes are sent, one per third of interval,
+        so dead connection is found after two intervals.
+        Options, unknown to platform, are skipped.
+        """
+        interval = max(int(interval), 3)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for name, value in (
+            ("TCP_KEEPIDLE", interval),
+            ("TCP_KEEPALIVE", interval),
+            ("TCP_KEEPINTVL", interval//3),
+            ("TCP_KEEPCNT", 3),
+        ):
+            if hasattr(socket, name):
+                option = getattr(socket, name)
+                sock.setsockopt(socket.IPPROTO_TCP, option, value)
+
+    def _check_connection(self):
+        """Send heartbeat PING, if connection has been silent for too long.
+
+        Raise ConnectionError if it is lost.
+        """
+        if not self._heartbeat_interval or self._channel is None:
+            return
+        if monotonic() - self._last_response_time < self._heartbeat_interval:
+            return
+        self._get_response_to(self._send_request(Request.Type.PING))
 
     def _send_request(self, request_type, data=None):
-        request = Request(request_type, data)
-        self._socket.sendall(dumps(request))
+        request_id = self._next_id
+        self._next_id = (self._next_id + 1) % 2**32
+        request = Request(request_type, data, request_id)
+        payload = self._codec.encode_request(request)
+        try:
+            self._channel.send(payload)
+        except OSError as error:
+            raise ConnectionError(error) from error
+        return request_id
 
     def _get_response(self):
         try:
-            return loads(self._socket.recv(1024))
+            response = self._codec.decode_response(self._channel.recv())
         except:
             raise ConnectionError
+        self._last_response_time = monotonic()
+        return response
+
+    def _get_response_to(self, request_id):
+        while request_id not in self._responses:
+            self._store(self._get_response())
+        return self._responses.pop(request_id)
+
+    def _store(self, response):
+        if response.request_id is None:
+            self._notifications.append(response)
+        else:
+            self._responses[response.request_id] = response
+
+    def poll_notifications(self):
+        """Get all notifications, recieved from server so far.
+
+        Doesn't wait for new ones.
+        Raises an exception if connection lost.
+        """
+        if self._channel:
+            while self._channel.has_data():
+                self._store(self._get_response())
+        ret, self._notifications = self._notifications, []
+        return ret
 
     def execute(self, request_type, arg=None):
         """Send request and get response from server.
 
         Raises an exception if connection lost.
         """
-        self._send_request(request_type, arg)
-        return self._get_response()
+        self._check_connection()
+        return self._get_response_to(self._send_request(request_type, arg))
+
+    def execute_many(self, requests):
+        """Send all requests, then get all responses.
+
+        requests is a list of (request_type, arg) pairs.
+        Return list of responses in the same order.
+        Raises an exception if connection lost.
+        """
+        self._check_connection()
+        ids = [self._send_request(*request) for request in requests]
+        return [self._get_response_to(request_id) for request_id in ids]
+
+    def iter_pages(self, request_type, size=100):
+        """Iterate over pages of GET_USERS_PAGE or GET_USERS_NAMES_PAGE.
+
+        Yields lists of users or names, until all of them are recieved,
+        so they never have to fit in single response.
+        Raises an exception if connection lost.
+        """
+        after = None
+        while True:
+            response = self.execute(request_type, (after, size))
+            if not response.success:
+                raise ConnectionError(response.message)
+            page, after = response.data
+            if page:
+                yield page
+            if after is None:
+                return
+
+    def execute_batch(self, requests):
+        """Send all requests in single BATCH request.
+
+        requests is a list of (request_type, arg) pairs.
+        Server processes them in given order.
+        Return list of responses in the same order.
+        Raises an exception if connection lost.
+        """
+        response = self.execute(
+            Request.Type.BATCH,
+            [Request(request_type, arg) for request_type, arg in requests]
+        )
+        if not response.success:
+            raise ConnectionError(response.message)
+        return response.data
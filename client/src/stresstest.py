@@ -0,0 +1,199 @@
+"""Stress test of trades.
+
+Headless client, which makes many threads trade under the same users
+at once and checks, that credits and items of users are conserved:
+each of them must change exactly by sum of successful trades.
+Test needs server with simultanious_log_ins enabled,
+since it logs in into each account many times at once.
+"""
+
+import addshare
+from random import Random
+from sys import stderr
+from threading import Thread, Barrier, BrokenBarrierError, Lock
+from time import perf_counter
+from request import Request
+from serverhandler import ServerHandler
+from confighandler import open_config, transform_config
+
+
+class StressTest:
+    """Runs threads_per_user threads for each of users.
+
+    Each thread has its own connection, logged in as its user
+    log_ins times, so user gets enough credits to trade.
+    When all threads are logged in, state of users is read,
+    then threads buy and sell random ones of items cheapest items,
+    remembering what every successful trade has changed.
+    Few items make threads of one user fight for the same ones.
+    When all trades are done, state of users is read again
+    and compared with expected one. Credits and amounts of items
+    must not be negative too, since trades are checked before made.
+    """
+
+    def __init__(self, host, port, timeout, users, threads_per_user, log_ins,
+                 items, trades, seed=None):
+        """Create stress test.
+
+        users is number of accounts to trade under.
+        trades is number of trades, sent by each thread.
+        """
+        self._address = host, port, timeout
+        self._users = users
+        self._threads_per_user = threads_per_user
+        self._log_ins = max(log_ins, 1)
+        self._items_count = max(items, 1)
+        self._trades = trades
+        self._seed = seed
+
+        self._lock = Lock()
+        self._barrier = Barrier(users*threads_per_user)
+        self._items = {}
+        self._before = {}
+        self._after = {}
+        self._changes = {}
+        self._errors = []
+        self._count = 0
+
+    def run(self):
+        """Run test and return list of found inconsistencies."""
+        threads = [
+            Thread(target=self._run_thread, args=(number,), daemon=True)
+            for number in range(self._users*self._threads_per_user)
+        ]
+        start = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = perf_counter() - start
+
+        if self._errors:
+            return self._errors
+        print(
+            f"{self._count} successful trades of "
+            f"{len(threads)*self._trades}, "
+            f"{len(threads)*self._trades/duration:.0f} trades/s"
+        )
+        return self._check()
+
+    def _run_thread(self, number):
+        user_name = f"stress{number % self._users}"
+        leader = number < self._users
+        random = Random(None if self._seed is None else self._seed + number)
+        changes = {}
+        count = 0
+        server = ServerHandler(*self._address)
+        try:
+            server.reconnect()
+            for _ in range(self._log_ins):
+                response = server.execute(Request.Type.LOG_IN, user_name)
+                if not response.success:
+                    raise RuntimeError(response.message)
+            if leader:
+                with self._lock:
+                    for item in server.execute(
+                        Request.Type.GET_ALL_ITEMS
+                    ).data:
+                        self._items[item.name] = item
+            self._barrier.wait()
+            if leader:
+                self._before[user_name] = self._read_user(server)
+            self._barrier.wait()
+
+            items_names = sorted(
+                self._items,
+                key=lambda name: self._items[name].buying_price
+            )[:self._items_count]
+            for _ in range(self._trades):
+                item_name = random.choice(items_names)
+                amount = random.randint(1, 3)
+                if random.random() < 0.5:
+                    request_type = Request.Type.PURCHASE_ITEM
+                    credits = -self._items[item_name].buying_price*amount
+                    change = amount
+                else:
+                    request_type = Request.Type.SELL_ITEM
+                    credits = self._items[item_name].selling_price*amount
+                    change = -amount
+                response = server.execute(request_type, (item_name, amount))
+                if response.success:
+                    changes[None] = changes.get(None, 0) + credits
+                    changes[item_name] = changes.get(item_name, 0) + change
+                    count += 1
+
+            self._barrier.wait()
+            if leader:
+                self._after[user_name] = self._read_user(server)
+            self._barrier.wait()
+            server.execute(Request.Type.LOG_OUT)
+        except (ConnectionError, OSError, RuntimeError) as error:
+            with self._lock:
+                self._errors.append(
+                    f"{user_name}: {type(error).__name__}: {error}"
+                )
+            self._barrier.abort()
+        except BrokenBarrierError:
+            pass
+
+        with self._lock:
+            self._count += count
+            user_changes = self._changes.setdefault(user_name, {})
+            for key, value in changes.items():
+                user_changes[key] = user_changes.get(key, 0) + value
+
+    @staticmethod
+    def _read_user(server):
+        user = server.execute(Request.Type.GET_CURRENT_USER).data
+        return user.credits, dict(user.items)
+
+    def _check(self):
+        ret = []
+        for user_name, (credits, items) in sorted(self._before.items()):
+            changes = self._changes.get(user_name, {})
+            got_credits, got_items = self._after[user_name]
+            ret += self._compare(user_name, "credits", got_credits,
+                                 credits + changes.get(None, 0))
+            for item_name in sorted(set(items) | set(got_items)
+                                    | set(changes) - {None}):
+                ret += self._compare(
+                    user_name, item_name, got_items.get(item_name, 0),
+                    items.get(item_name, 0) + changes.get(item_name, 0)
+                )
+        return ret
+
+    @staticmethod
+    def _compare(user_name, what, got, expected):
+        if got != expected:
+            return [f"{user_name}: {got} {what}, expected {expected}"]
+        if got < 0:
+            return [f"{user_name}: {got} {what}"]
+        return []
+
+
+def run():
+    """Run stress test and report, if credits and items are conserved."""
+    config_must_have = {
+        "host": str,
+        "port": int,
+        "timeout": float,
+        "users": int,
+        "threads_per_user": int,
+        "log_ins": int,
+        "items": int,
+        "trades": int
+    }
+    config = open_config("client/cfg/stresstest_config.json")
+    if config is None or not transform_config(config, config_must_have):
+        return False
+
+    problems = StressTest(**config).run()
+    for problem in problems:
+        print(problem, file=stderr)
+    if not problems:
+        print("Credits and items are conserved")
+    return not problems
+
+
+if __name__ == "__main__":
+    exit(0 if run() else 1)
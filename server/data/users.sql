@@ -1,7 +1,7 @@
 CREATE TABLE users (
     name TEXT PRIMARY KEY,
     credits INT
-);
+) WITHOUT ROWID;
 INSERT INTO users VALUES
     ('Jon', 108),
     ('Dany', 129),
@@ -10,10 +10,15 @@ CREATE TABLE users_items (
     user_name TEXT,
     item_name TEXT,
     amount INTEGER,
-    FOREIGN KEY(user_name) REFERENCES users(name),
-    UNIQUE(user_name, item_name)
-);
+    PRIMARY KEY(user_name, item_name),
+    FOREIGN KEY(user_name) REFERENCES users(name)
+) WITHOUT ROWID;
 INSERT INTO users_items VALUES
     ('Jon', 'Longclaw', 1),
     ('Dany', 'dragon', 2),
-    ('Cersei', 'Mountain', 1);
\ No newline at end of file
+    ('Cersei', 'Mountain', 1);
+CREATE TABLE sessions (
+    user_name TEXT PRIMARY KEY,
+    worker INTEGER
+);
+PRAGMA user_version = 2;
\ No newline at end of file
@@ -0,0 +1,123 @@
+"""Module contains AsyncClientHandler."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from transport import pack_frame, read_frame, MAX_FRAME_SIZE
+from connection import Connection
+
+
+class AsyncClientHandler:
+    """AsyncClientHandler handles connection with clients on server side.
+
+    TCP-based, same as ClientHandler, but all connections are served
+    by single asyncio event loop instead of thread per client.
+    Requests themselves are processed in bounded pool of threads,
+    so data base access never blocks the loop.
+    Client, which doesn't read notifications, is disconnected,
+    when too much of them is waiting in its write buffer.
+    """
+
+    _backlog = 1024
+    _max_pending_push_bytes = 1024*1024
+
+    def __init__(self, port, server_core, workers, listener=None,
+                 max_frame_size=MAX_FRAME_SIZE):
+        """Initialize server, listening to given port.
+
+        Takes port, ServerCore instance and number of threads,
+        which process requests, as arguments.
+        Clients, which send frames bigger than max_frame_size,
+        are disconnected.
+        listener is optional socket, which is already listening,
+        such as one, shared by several server processes.
+        Port is ignored, if it is given.
+        """
+        self._port = port
+        self._server_core = server_core
+        self._max_frame_size = max_frame_size
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._loop = asyncio.new_event_loop()
+        self._tasks = set()
+        if listener is None:
+            address = {"host": "127.0.0.1", "port": port}
+        else:
+            address = {"sock": listener}
+        self._server = self._loop.run_until_complete(asyncio.start_server(
+            self._on_connection,
+            backlog=self._backlog,
+            **address
+        ))
+
+    @property
+    def server_address(self):
+        """Get address server is listening to."""
+        return self._server.sockets[0].getsockname()
+
+    def serve_forever(self):
+        """Serve clients until shutdown is called."""
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            for task in self._tasks:
+                task.cancel()
+            closing = [self._loop.create_task(self._server.wait_closed())]
+            self._loop.run_until_complete(asyncio.gather(
+                *closing,
+                *self._tasks,
+                return_exceptions=True
+            ))
+            self._executor.shutdown()
+            self._loop.close()
+
+    def shutdown(self):
+        """Stop serving clients.
+
+        Can be called from any thread.
+        """
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def _on_connection(self, reader, writer):
+        task = self._loop.create_task(self._handle(reader, writer))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _push(self, writer, payload):
+        """Send notification from any thread without waiting for it."""
+        transport = writer.transport
+        if transport.get_write_buffer_size() > self._max_pending_push_bytes:
+            self._loop.call_soon_threadsafe(transport.abort)
+            raise RuntimeError("Client doesn't read notifications")
+        self._loop.call_soon_threadsafe(writer.write, pack_frame(payload))
+
+    async def _handle(self, reader, writer):
+        address = writer.get_extra_info("peername")
+        connection = Connection(
+            self._server_core,
+            lambda payload: self._push(writer, payload),
+            self._max_frame_size
+        )
+        print("New connection:", address)
+        try:
+            while True:
+                request = await read_frame(reader, self._max_frame_size)
+                if request is None:
+                    break
+                response = await self._loop.run_in_executor(
+                    self._executor,
+                    connection.process,
+                    request
+                )
+                writer.write(pack_frame(response))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        except ValueError:
+            print("Malformed request:", address)
+        finally:
+            print("Connection lost:", address)
+            writer.close()
+            await self._loop.run_in_executor(
+                self._executor,
+                connection.close
+            )
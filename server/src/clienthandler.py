@@ -1,42 +1,115 @@
 """Module contains ClientHandler."""
 
+from queue import Queue, Full
+from socket import SHUT_RDWR
 from socketserver import TCPServer, ThreadingMixIn, BaseRequestHandler
-from pickle import dumps, loads
+from threading import Lock, Thread
+from transport import FramedSocket, MAX_FRAME_SIZE
+from connection import Connection
 
 
 class ClientHandler(ThreadingMixIn, TCPServer):
     """ClientHandler handles connection with clients on server side.
 
     TCP-based.
+    Notifications are queued and sent by separate thread of connection,
+    so server never waits for client, which doesn't read them.
+    Such client is disconnected, when its queue is full.
     """
 
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
     class _Handler(BaseRequestHandler):
 
         server_core = None
+        max_frame_size = None
+        max_pending_pushes = 64
 
         def setup(self):
-            self._server = self.server_core.get_handler()
+            self._channel = FramedSocket(
+                self.request,
+                max_frame_size=self.max_frame_size
+            )
+            self._pushes = Queue(self.max_pending_pushes)
+            self._pusher = None
+            self._pusher_lock = Lock()
+            self._connection = Connection(
+                self.server_core,
+                self._push,
+                self.max_frame_size
+            )
+
+        def _push(self, payload):
+            with self._pusher_lock:
+                if self._pusher is None:
+                    self._pusher = Thread(target=self._send_pushes,
+                                          daemon=True)
+                    self._pusher.start()
+            try:
+                self._pushes.put_nowait(payload)
+            except Full:
+                try:
+                    self.request.shutdown(SHUT_RDWR)
+                except OSError:
+                    pass
+                raise RuntimeError("Client doesn't read notifications")
+
+        def _send_pushes(self):
+            while True:
+                payload = self._pushes.get()
+                if payload is None:
+                    return
+                try:
+                    self._channel.send(payload)
+                except OSError:
+                    return
 
         def handle(self):
             print("New connection:", self.client_address)
             while True:
-                request = self.request.recv(1024)
-                if not request:
+                try:
+                    request = self._channel.recv()
+                except ConnectionError:
+                    break
+                if request is None:
+                    break
+                try:
+                    response = self._connection.process(request)
+                except ValueError:
+                    print("Malformed request:", self.client_address)
                     break
-                request = loads(request)
-                response = self._server.process_request(request)
-                response = dumps(response)
-                self.request.send(response)
+                self._channel.send(response)
             print("Connection lost:", self.client_address)
             self.request.close()
 
         def finish(self):
-            self._server.deactivate_user()
+            self._connection.close()
+            try:
+                self._pushes.put_nowait(None)
+            except Full:
+                pass
 
-    def __init__(self, port, server_core):
+    def __init__(self, port, server_core, listener=None,
+                 max_frame_size=MAX_FRAME_SIZE):
         """Initialize server, listening to given port.
 
         Takes port and ServerCore instance as arguments.
+        Clients, which send frames bigger than max_frame_size,
+        are disconnected.
+        listener is optional socket, which is already listening,
+        such as one, shared by several server processes.
+        Port is ignored, if it is given.
         """
-        super().__init__(("127.0.0.1", port), ClientHandler._Handler)
+        super().__init__(
+            ("127.0.0.1", port),
+            ClientHandler._Handler,
+            bind_and_activate=listener is None
+        )
+        if listener is not None:
+            self.socket.close()
+            self.socket = listener
+            self.server_address = listener.getsockname()
         ClientHandler._Handler.server_core = server_core
+        ClientHandler._Handler.max_frame_size = max_frame_size
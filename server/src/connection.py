@@ -0,0 +1,114 @@
+"""Module contains Connection class."""
+
+from time import perf_counter
+from zlib import compress
+from codec import DEFAULT_CODEC, choose_codec
+from compression import COMPRESSION, CompressedCodec
+from request import Request, Response
+from transport import MAX_FRAME_SIZE
+
+
+class Connection:
+    """State of single connection with client.
+
+    Connection doesn't know anything about sockets.
+    It takes raw requests, passes them to its own ServerCore._Handler
+    and returns raw responses.
+    It also keeps options, negotiated with client,
+    such as codec and compression.
+    Both ClientHandler and AsyncClientHandler use it.
+    Time of decoding, processing and encoding of requests
+    is recorded into metrics of ServerCore.
+    """
+
+    def __init__(self, server_core, push=None, max_frame_size=MAX_FRAME_SIZE):
+        """Create connection, served by handler from given ServerCore.
+
+        push is called with raw notifications, which are sent to client
+        without request. If it is None, client can't subscribe.
+        It can be called from any thread and must not block:
+        it raises RuntimeError, if client doesn't keep up.
+        Compressed requests can't grow bigger than max_frame_size,
+        when they are decompressed.
+        """
+        self._push = push
+        self._max_frame_size = max_frame_size
+        self._server_core = server_core
+        self._handler = server_core.get_handler(push and self._notify)
+        self._codec = DEFAULT_CODEC
+        self._metrics = server_core.metrics
+        self._metrics.adjust("open_connections", 1)
+        self._recorder = self._metrics.recorder()
+        self._profiler = server_core.profiler
+
+    def process(self, payload):
+        """Process raw request from client and return raw response.
+
+        Raise ValueError if request is malformed.
+        Response has the same id as request.
+        """
+        start = perf_counter()
+        request = self._codec.decode_request(payload)
+        decoded = perf_counter()
+        if request.request_type is Request.Type.PING and request.data:
+            return self._negotiate(request)
+        response = self._profiler.run(
+            request.request_type,
+            self._handler.process_request,
+            request
+        )
+        response.request_id = request.request_id
+        processed = perf_counter()
+        ret = self._codec.encode_response(response)
+
+        recorder = self._recorder
+        recorder.observe("decode", decoded - start)
+        recorder.observe("request", processed - decoded,
+                         request.request_type.name)
+        recorder.observe("encode", perf_counter() - processed)
+        return ret
+
+    def close(self):
+        """Release resources, bound to connection."""
+        self._handler.unsubscribe()
+        self._handler.disconnect()
+        self._metrics.release(self._recorder)
+        self._metrics.adjust("open_connections", -1)
+
+    def _notify(self, response):
+        self._push(self._codec.encode_response(response))
+
+    def _negotiate(self, request):
+        options = request.data
+        offered_codecs = options.get("codecs", [])
+        if not isinstance(offered_codecs, (list, tuple)):
+            offered_codecs = []
+        codec = choose_codec(offered_codecs)
+        data = {"codec": codec.name}
+        offered_compressions = options.get("compression", [])
+        if not isinstance(offered_compressions, (list, tuple)):
+            offered_compressions = []
+        threshold = self._server_core.compression_threshold
+        if threshold > 0 and COMPRESSION in offered_compressions:
+            zdict_hash, zdict = self._server_core.compression_dictionary()
+            data.update(
+                compression=COMPRESSION,
+                threshold=threshold,
+                zdict_hash=zdict_hash
+            )
+            if options.get("zdict_hash") != zdict_hash:
+                data["zdict"] = compress(zdict, 9)
+            codec = CompressedCodec(
+                codec,
+                threshold,
+                zdict,
+                max_size=self._max_frame_size
+            )
+        response = Response(
+            Request.Type.PING,
+            data=data,
+            request_id=request.request_id
+        )
+        ret = self._codec.encode_response(response)
+        self._codec = codec
+        return ret
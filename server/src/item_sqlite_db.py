@@ -3,59 +3,177 @@
 It is used to read sqlite-based data bases with Items.
 """
 
-from sqlite3 import connect as connect_sqlite
+from collections import OrderedDict
+from hashlib import sha1
+from itertools import starmap
+from json import dumps
+from threading import Lock
+from sqlite_pool import ConnectionPool
 from item import Item
 
 
+class Catalogue:
+    """Immutable snapshot of all items in data base.
+
+    Lookups are O(1), lists of names and items are built once.
+    Every snapshot has version, which grows each time items change.
+    Version is counted by each process from its start, while digest
+    depends on items only, so it is the same for all processes
+    and survives restart of server.
+    """
+
+    def __init__(self, version, items):
+        """Create snapshot of given version from list of items."""
+        self._version = version
+        self._items = {item.name: item for item in items}
+        self._keys = tuple(self._items)
+        self._values = tuple(self._items.values())
+        self._digest = sha1(dumps(sorted(
+            (item.name, item.buying_price, item.selling_price)
+            for item in self._values
+        )).encode()).hexdigest()
+
+    @property
+    def version(self):
+        """Get version of snapshot."""
+        return self._version
+
+    @property
+    def digest(self):
+        """Get hash of all items in snapshot."""
+        return self._digest
+
+    def changes_from(self, old):
+        """Get changes, which turn old snapshot into this one.
+
+        Return list of new and changed items and list of names
+        of removed items.
+        """
+        changed = [item for item in self._values if old.get(item.name) != item]
+        removed = [name for name in old.keys() if name not in self._items]
+        return changed, removed
+
+    def keys(self):
+        """Get tuple of all items names."""
+        return self._keys
+
+    def values(self):
+        """Get tuple of all items."""
+        return self._values
+
+    def get(self, item_name, default=None):
+        """Get item with given name, or default, if there is none."""
+        return self._items.get(item_name, default)
+
+    def __contains__(self, item_name):
+        """Check if item with given name is in snapshot."""
+        return item_name in self._items
+
+    def __getitem__(self, item_name):
+        """Get item with given name."""
+        return self._items[item_name]
+
+    def __len__(self):
+        """Get number of items in snapshot."""
+        return len(self._items)
+
+
 class ItemsDB:
     """Class handles SQLite-based data base with items.
 
     Behaves like dict for the most part.
+    Items are read once and kept in memory as Catalogue snapshot.
+    Call reload to pick up changes, made to data base.
+    Readers never lock: they just take the current snapshot.
+    A few recent snapshots are kept, so clients, which have
+    one of them cached, can get just changes since then.
     """
 
-    def __init__(self, path):
-        """Open connection to data base with items."""
+    _history_size = 16
+
+    def __init__(self, path, pool_size=1, pragmas=None, metrics=None):
+        """Open connections to data base with items and read them.
+
+        pool_size is number of connections, shared between threads.
+        pragmas is a dict of SQLite PRAGMAs, applied to each connection.
+        metrics is optional Metrics, which gets statistics of queries.
+        """
         self._path = path
+        self._pool = ConnectionPool(path, pool_size, pragmas, metrics)
+        self._reload_lock = Lock()
+        self._catalogue = Catalogue(1, self._read_items())
+        self._history = OrderedDict()
+        self._remember(self._catalogue)
 
     def _execute(self, query, *args):
-        with connect_sqlite(self._path) as connection:
-            cursor = connection.cursor()
-            cursor.execute(query, *args)
-            ret = cursor.fetchall()
-            return ret
-
-    def keys(self):
-        """Get list of all items names in data base."""
-        tuples = self._execute("SELECT name FROM items")
-        ret = [tup[0] for tup in tuples]
-        return ret
+        return self._pool.execute(query, *args)
 
-    def values(self):
-        """Get list of all items."""
+    def _read_items(self):
         tuples = self._execute(
             "SELECT name, selling_price, buying_price FROM items"
         )
-        return [Item(name, buy, sell) for name, buy, sell in tuples]
+        return list(starmap(Item, tuples))
+
+    @property
+    def version(self):
+        """Get version of current snapshot of items."""
+        return self._catalogue.version
+
+    def snapshot(self):
+        """Get current Catalogue.
+
+        Use it to make several lookups, consistent with each other.
+        """
+        return self._catalogue
+
+    def reload(self):
+        """Read items from data base again.
+
+        If anything has changed, new snapshot with next version
+        replaces the current one. Return the current snapshot.
+        """
+        with self._reload_lock:
+            items = self._read_items()
+            current = self._catalogue
+            if items != list(current.values()):
+                self._catalogue = Catalogue(current.version + 1, items)
+                self._remember(self._catalogue)
+            return self._catalogue
+
+    def _remember(self, catalogue):
+        self._history.pop(catalogue.digest, None)
+        self._history[catalogue.digest] = catalogue
+        while len(self._history) > self._history_size:
+            self._history.popitem(last=False)
+
+    def changes_since(self, digest):
+        """Get changes of items since snapshot with given digest.
+
+        Return the current snapshot, list of new and changed items
+        and list of names of removed items. Lists are None,
+        if snapshot is unknown: too old, or older than server.
+        """
+        with self._reload_lock:
+            current = self._catalogue
+            old = self._history.get(digest)
+        if old is None:
+            return current, None, None
+        if old is current:
+            return current, [], []
+        return (current,) + current.changes_from(old)
+
+    def keys(self):
+        """Get tuple of all items names in data base."""
+        return self._catalogue.keys()
+
+    def values(self):
+        """Get tuple of all items."""
+        return self._catalogue.values()
 
     def __contains__(self, item_name):
         """Check if item with given name is in db."""
-        tuples = self._execute(
-            "SELECT name FROM items WHERE name == ?",
-            (item_name,)
-        )
-        return len(tuples) == 1
+        return item_name in self._catalogue
 
     def __getitem__(self, item_name):
         """Get item with given name."""
-        tuples = self._execute(
-            "SELECT name, selling_price, buying_price \
-             FROM items \
-             WHERE name == ?",
-            (item_name,)
-        )
-        if not tuples:
-            raise KeyError
-        name, buy, sell = tuples[0]
-        return Item(name, buy, sell)
-
-# TODO check about multythread access
+        return self._catalogue[item_name]
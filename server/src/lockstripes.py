@@ -0,0 +1,22 @@
+"""Module contains LockStripes class."""
+
+from threading import RLock
+
+
+class LockStripes:
+    """Fixed set of locks, shared between keys.
+
+    Each key is always mapped to the same lock,
+    while different keys are most likely mapped to different ones.
+    So work with unrelated keys goes in parallel,
+    and there is no need to keep lock for every key.
+    Locks are reentrant.
+    """
+
+    def __init__(self, count):
+        """Create given number of locks."""
+        self._locks = [RLock() for _ in range(max(count, 1))]
+
+    def __getitem__(self, key):
+        """Get lock for given key."""
+        return self._locks[hash(key) % len(self._locks)]
@@ -0,0 +1,270 @@
+"""Module contains Histogram and Metrics classes.
+
+They are used to collect statistics of server with low overhead.
+"""
+
+from threading import Lock
+
+
+class Histogram:
+    """HDR-style histogram of durations.
+
+    Durations are recorded in microseconds into log-linear buckets:
+    each power of two is split into 2**SUB_BITS buckets,
+    so relative error of percentiles never exceeds 2**-SUB_BITS.
+    Recording takes constant time and memory grows only with
+    logarithm of the biggest value.
+    Histogram isn't thread-safe by itself.
+    """
+
+    SUB_BITS = 4
+
+    def __init__(self):
+        """Create empty histogram."""
+        self._buckets = [0]*(2 << self.SUB_BITS)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+
+    @classmethod
+    def _upper_bound(cls, index):
+        sub_buckets = 1 << cls.SUB_BITS
+        if index < 2*sub_buckets:
+            return index + 1
+        shift = (index >> cls.SUB_BITS) - 1
+        return (index - (shift << cls.SUB_BITS) + 1) << shift
+
+    @property
+    def count(self):
+        """Get number of recorded values."""
+        return self._count
+
+    def record(self, seconds):
+        """Record duration in seconds."""
+        micros = int(seconds*1000000)
+        shift = micros.bit_length() - self.SUB_BITS - 1
+        if shift > 0:
+            micros = (shift << self.SUB_BITS) + (micros >> shift)
+        buckets = self._buckets
+        if micros >= len(buckets):
+            buckets.extend([0]*(micros + 1 - len(buckets)))
+        buckets[micros] += 1
+        self._count += 1
+        self._sum += seconds
+        if seconds > self._max:
+            self._max = seconds
+
+    def merge(self, other):
+        """Add all values, recorded by other histogram."""
+        buckets = self._buckets
+        if len(other._buckets) > len(buckets):
+            buckets.extend([0]*(len(other._buckets) - len(buckets)))
+        for index, count in enumerate(other._buckets):
+            buckets[index] += count
+        self._count += other._count
+        self._sum += other._sum
+        self._max = max(self._max, other._max)
+
+    def percentile(self, percent):
+        """Get upper bound of given percentile in seconds."""
+        if not self._count:
+            return 0.0
+        rank = self._count*percent/100
+        seen = 0
+        for index, count in enumerate(self._buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(self._upper_bound(index)/1e6, self._max)
+        return self._max
+
+    def copy(self):
+        """Get independent copy of histogram."""
+        ret = Histogram()
+        ret.merge(self)
+        return ret
+
+    def summary(self):
+        """Get dict with count, sum, mean, max and percentiles.
+
+        Durations are in seconds.
+        """
+        return {
+            "count": self._count,
+            "sum": self._sum,
+            "mean": self._sum/self._count if self._count else 0.0,
+            "max": self._max,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p999": self.percentile(99.9),
+        }
+
+
+class Recorder:
+    """Histograms of single writer, such as connection.
+
+    Recording takes no locks. Recorder is created by Metrics,
+    which includes it into reports until it is released.
+    """
+
+    def __init__(self):
+        """Create empty recorder."""
+        self._histograms = {}
+
+    @property
+    def histograms(self):
+        """Get dict of histograms by name and label."""
+        return self._histograms
+
+    def observe(self, name, seconds, label=""):
+        """Record duration in histogram with given name and label."""
+        key = name, label
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram()
+        histogram.record(seconds)
+
+
+class Metrics:
+    """Thread-safe registry of histograms, counters and gauges.
+
+    Each metric has name and optional label, such as request type.
+    Sources are functions, which return dicts of values.
+    They are called only when report is requested.
+    Frequent writers should record into their own Recorder,
+    so they never contend for lock.
+    """
+
+    _quantiles = {"p50": "0.5", "p90": "0.9", "p99": "0.99", "p999": "0.999"}
+
+    def __init__(self):
+        """Create empty registry."""
+        self._lock = Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._sources = {}
+        self._recorders = set()
+
+    def recorder(self):
+        """Get new Recorder, which is included into reports."""
+        recorder = Recorder()
+        with self._lock:
+            self._recorders.add(recorder)
+        return recorder
+
+    def release(self, recorder):
+        """Merge values of recorder into registry and forget it."""
+        with self._lock:
+            self._recorders.discard(recorder)
+            self._merge(self._histograms, recorder.histograms)
+
+    @staticmethod
+    def _merge(histograms, other):
+        for key, histogram in other.items():
+            if key in histograms:
+                histograms[key].merge(histogram)
+            else:
+                histograms[key] = histogram.copy()
+
+    def observe(self, name, seconds, label=""):
+        """Record duration in histogram with given name and label."""
+        key = name, label
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.record(seconds)
+
+    def increment(self, name, count=1, label=""):
+        """Add count to counter with given name and label."""
+        key = name, label
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + count
+
+    def adjust(self, name, delta, label=""):
+        """Add delta to gauge with given name and label."""
+        key = name, label
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def add_source(self, name, function):
+        """Add function, which returns dict of gauges.
+
+        Gauges are reported with given name as prefix.
+        """
+        with self._lock:
+            self._sources[name] = function
+
+    def report(self):
+        """Get dict with all metrics.
+
+        Histograms, counters and gauges are grouped by name, then by label.
+        """
+        with self._lock:
+            histograms = {}
+            self._merge(histograms, self._histograms)
+            for recorder in self._recorders:
+                self._merge(histograms, dict(recorder.histograms))
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            sources = dict(self._sources)
+
+        for source_name, function in sources.items():
+            for name, value in function().items():
+                gauges[f"{source_name}_{name}", ""] = value
+
+        return {
+            "histograms": self._group({
+                key: histogram.summary()
+                for key, histogram in histograms.items()
+            }),
+            "counters": self._group(counters),
+            "gauges": self._group(gauges),
+        }
+
+    @staticmethod
+    def _group(metrics):
+        ret = {}
+        for (name, label), value in sorted(metrics.items()):
+            ret.setdefault(name, {})[label] = value
+        return ret
+
+    def text(self):
+        """Get all metrics in plaintext exposition format.
+
+        Histograms are shown as summaries in seconds.
+        """
+        report = self.report()
+        lines = []
+        for name, labels in report["histograms"].items():
+            lines.append(f"# TYPE server_{name}_seconds summary")
+            for label, summary in labels.items():
+                for key, quantile in self._quantiles.items():
+                    lines.append(self._line(
+                        f"{name}_seconds", label, summary[key],
+                        quantile=quantile
+                    ))
+                lines.append(self._line(
+                    f"{name}_seconds_sum", label, summary["sum"]
+                ))
+                lines.append(self._line(
+                    f"{name}_seconds_count", label, summary["count"]
+                ))
+        for kind in ["counters", "gauges"]:
+            metric_type = "counter" if kind == "counters" else "gauge"
+            for name, labels in report[kind].items():
+                lines.append(f"# TYPE server_{name} {metric_type}")
+                for label, value in labels.items():
+                    lines.append(self._line(name, label, value))
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _line(name, label, value, quantile=None):
+        labels = []
+        if label:
+            labels.append(f'label="{label}"')
+        if quantile:
+            labels.append(f'quantile="{quantile}"')
+        labels = "{" + ",".join(labels) + "}" if labels else ""
+        return f"server_{name}{labels} {value}"
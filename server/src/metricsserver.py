@@ -0,0 +1,41 @@
+"""Module contains MetricsServer."""
+
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    """Plaintext metrics listener.
+
+    Answers any GET request with all metrics in plaintext
+    exposition format, so it can be read with curl or scraped.
+    Listens to local interface only.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    class _Handler(BaseHTTPRequestHandler):
+
+        metrics = None
+
+        def do_GET(self):
+            body = self.metrics.text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_):
+            pass
+
+    def __init__(self, port, metrics):
+        """Initialize server, listening to given port.
+
+        Takes port and Metrics instance as arguments.
+        """
+        handler = type("Handler", (MetricsServer._Handler,), {
+            "metrics": metrics
+        })
+        super().__init__(("127.0.0.1", port), handler)
@@ -0,0 +1,137 @@
+"""Module contains Persister class."""
+
+from sys import stderr
+from threading import Thread, Condition
+from time import monotonic
+
+
+class Persister(Thread):
+    """Background thread, which commits changes of users into data base.
+
+    Handlers only report changes with notify, so no client has to wait
+    for commit. Changes from all handlers are committed together,
+    when batch_size of them accumulate, when max_delay seconds pass
+    since the first uncommitted change, or when flush is requested.
+    """
+
+    def __init__(self, users_db, batch_size, max_delay):
+        """Create persister for given UsersDB.
+
+        Call start to run it.
+        """
+        super().__init__(name="Persister", daemon=True)
+        self._users = users_db
+        self._batch_size = max(batch_size, 1)
+        self._max_delay = max_delay
+        self._condition = Condition()
+
+        self._pending = 0
+        self._first_pending_time = None
+        self._flush_requested = False
+        self._stopping = False
+        self._started_flushes = 0
+        self._finished_flushes = 0
+
+        self._failed_flushes = 0
+        self._last_flush_duration = 0.0
+        self._max_flush_duration = 0.0
+        self._total_flush_duration = 0.0
+
+    @property
+    def queue_depth(self):
+        """Get number of changes, which are not committed yet."""
+        return self._pending
+
+    def stats(self):
+        """Get dict with statistics of commits.
+
+        Durations are in seconds.
+        """
+        with self._condition:
+            return {
+                "queue_depth": self._pending,
+                "flushes": self._finished_flushes,
+                "failed_flushes": self._failed_flushes,
+                "last_flush_duration": self._last_flush_duration,
+                "max_flush_duration": self._max_flush_duration,
+                "total_flush_duration": self._total_flush_duration,
+            }
+
+    def notify(self, count=1):
+        """Report given number of changes."""
+        with self._condition:
+            first = not self._pending
+            if first:
+                self._first_pending_time = monotonic()
+            self._pending += count
+            if first or self._pending >= self._batch_size:
+                self._condition.notify_all()
+
+    def flush(self, wait=False):
+        """Request commit of all changes, reported so far.
+
+        If wait is set, block until they are committed.
+        """
+        with self._condition:
+            self._flush_requested = True
+            target = self._started_flushes + 1
+            self._condition.notify_all()
+            while wait and self._finished_flushes < target \
+                    and self.is_alive():
+                self._condition.wait()
+
+    def stop(self):
+        """Commit all changes and stop thread."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self.is_alive():
+            self.join()
+        else:
+            self._users.commit()
+
+    def run(self):
+        """Commit changes until stopped."""
+        while True:
+            with self._condition:
+                self._wait_for_flush()
+                stopping = self._stopping
+                self._pending = 0
+                self._first_pending_time = None
+                self._flush_requested = False
+                self._started_flushes += 1
+            self._commit()
+            if stopping:
+                return
+
+    def _wait_for_flush(self):
+        while not (self._stopping or self._flush_requested or
+                   self._pending >= self._batch_size):
+            if self._pending:
+                delay = monotonic() - self._first_pending_time
+                if delay >= self._max_delay:
+                    return
+                self._condition.wait(self._max_delay - delay)
+            else:
+                self._condition.wait()
+
+    def _commit(self):
+        start = monotonic()
+        try:
+            self._users.commit()
+            failed = False
+        except Exception as error:
+            print("Unable to commit users:", error, file=stderr)
+            failed = True
+        duration = monotonic() - start
+        with self._condition:
+            if failed:
+                self._failed_flushes += 1
+                if not self._pending:
+                    self._first_pending_time = monotonic()
+                self._pending += 1
+            self._finished_flushes += 1
+            self._last_flush_duration = duration
+            self._max_flush_duration = max(self._max_flush_duration, duration)
+            self._total_flush_duration += duration
+            self._condition.notify_all()
@@ -0,0 +1,181 @@
+"""Module contains Profiler class.
+
+It is used to find out, where server spends time, without restart.
+"""
+
+from cProfile import Profile
+from os import makedirs
+from os.path import basename, join
+from pstats import Stats
+from sys import setprofile
+from threading import Lock
+from time import perf_counter
+
+
+class _StackTracer:
+    """Lightweight tracer, which collects time of each call stack.
+
+    Time is attributed to the innermost call, so results
+    can be written in collapsed-stack format, used by flame graphs.
+    """
+
+    def __init__(self, root, times):
+        self._stack = [root]
+        self._times = times
+        self._last = perf_counter()
+
+    @staticmethod
+    def _name(frame, event, arg):
+        if event == "c_call":
+            return getattr(arg, "__qualname__", repr(arg))
+        code = frame.f_code
+        return f"{code.co_name} ({basename(code.co_filename)}:" \
+            f"{code.co_firstlineno})"
+
+    def __call__(self, frame, event, arg):
+        now = perf_counter()
+        key = ";".join(self._stack)
+        self._times[key] = self._times.get(key, 0.0) + now - self._last
+        if event in ("call", "c_call"):
+            self._stack.append(self._name(frame, event, arg))
+        elif len(self._stack) > 1:
+            self._stack.pop()
+        self._last = perf_counter()
+
+    def run(self, function, *args):
+        """Call function with args under tracer and return its result."""
+        setprofile(self)
+        try:
+            return function(*args)
+        finally:
+            setprofile(None)
+
+
+class Profiler:
+    """Profiles every sample_rate-th request.
+
+    Results are aggregated per request type. Mode is either "cprofile",
+    which collects pstats, or "stacks", which collects collapsed stacks.
+    Only one request is profiled at a time.
+    Disabled profiler costs single check per request.
+    """
+
+    MODES = ("cprofile", "stacks")
+
+    def __init__(self, sample_rate=0, mode="cprofile", directory="."):
+        """Create profiler.
+
+        sample_rate is N in 1-in-N requests. 0 disables profiling.
+        directory is where dump writes files.
+        Raise ValueError if mode is unknown.
+        """
+        self._lock = Lock()
+        self._busy = Lock()
+        self._counter = 0
+        self._sample_rate = 0
+        self._mode = None
+        self._directory = directory
+        self._samples = {}
+        self._stats = {}
+        self._stacks = {}
+        self.configure(sample_rate, mode)
+
+    @property
+    def sample_rate(self):
+        """Get N in 1-in-N requests, which are profiled."""
+        return self._sample_rate
+
+    def configure(self, sample_rate=None, mode=None):
+        """Change sample rate or mode.
+
+        Changing mode drops results, collected so far.
+        Raise ValueError if mode is unknown or sample rate is negative.
+        """
+        if mode is not None and mode not in self.MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        if sample_rate is not None and sample_rate < 0:
+            raise ValueError(f"Invalid sample rate: {sample_rate}")
+        with self._lock:
+            if mode is not None and mode != self._mode:
+                self._mode = mode
+                self._reset()
+            if sample_rate is not None:
+                self._sample_rate = sample_rate
+
+    def reset(self):
+        """Drop results, collected so far."""
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self._samples, self._stats, self._stacks = {}, {}, {}
+
+    def run(self, request_type, function, *args):
+        """Call function with args and return its result.
+
+        Call is profiled, if it is the sample_rate-th one.
+        """
+        sample_rate = self._sample_rate
+        if not sample_rate:
+            return function(*args)
+        self._counter += 1
+        if self._counter % sample_rate or not self._busy.acquire(False):
+            return function(*args)
+        try:
+            return self._profile(request_type.name, function, *args)
+        finally:
+            self._busy.release()
+
+    def _profile(self, name, function, *args):
+        if self._mode == "cprofile":
+            profile = Profile()
+            ret = profile.runcall(function, *args)
+            with self._lock:
+                if name in self._stats:
+                    self._stats[name].add(profile)
+                else:
+                    self._stats[name] = Stats(profile)
+                self._samples[name] = self._samples.get(name, 0) + 1
+        else:
+            times = {}
+            ret = _StackTracer(name, times).run(function, *args)
+            with self._lock:
+                stacks = self._stacks.setdefault(name, {})
+                for key, duration in times.items():
+                    stacks[key] = stacks.get(key, 0.0) + duration
+                self._samples[name] = self._samples.get(name, 0) + 1
+        return ret
+
+    def state(self):
+        """Get dict with settings and number of samples per request type."""
+        with self._lock:
+            return {
+                "sample_rate": self._sample_rate,
+                "mode": self._mode,
+                "samples": dict(self._samples),
+            }
+
+    def dump(self):
+        """Write results into files, one per request type.
+
+        Files are named after request types and have .pstats or
+        .collapsed extension. Collapsed stacks are weighted
+        in microseconds. Return list of written paths.
+        Raise OSError if files can't be written.
+        """
+        makedirs(self._directory, exist_ok=True)
+        paths = []
+        with self._lock:
+            for name, stats in self._stats.items():
+                path = join(self._directory, f"{name}.pstats")
+                stats.dump_stats(path)
+                paths.append(path)
+            for name, stacks in self._stacks.items():
+                path = join(self._directory, f"{name}.collapsed")
+                with open(path, "w") as stream:
+                    for key, duration in sorted(stacks.items()):
+                        micros = int(duration*1000000)
+                        if micros:
+                            stream.write(f"{key} {micros}\n")
+                paths.append(path)
+        return paths
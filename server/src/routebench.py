@@ -0,0 +1,82 @@
+"""Benchmark of request dispatch.
+
+Measures how long ServerCore handler takes to process
+requests of several types, without network and codecs.
+Data bases are created from scripts in server/data
+in temporary directory, and persister isn't started,
+so changes of users are never written.
+"""
+
+import addshare
+from os.path import join
+from sqlite3 import connect
+from tempfile import TemporaryDirectory
+from timeit import repeat
+from item_sqlite_db import ItemsDB
+from user_sqlite_db import UsersDB
+from persister import Persister
+from servercore import ServerCore
+from request import Request
+
+NUMBER = 200000
+REPEAT = 5
+
+
+def create_data_base(directory, name):
+    """Create data base from script in server/data and get its path."""
+    path = join(directory, f"{name}.db")
+    with open(f"server/data/{name}.sql", "r") as script:
+        connection = connect(path)
+        connection.executescript(script.read())
+        connection.commit()
+        connection.close()
+    return path
+
+
+def sample_requests():
+    """Get list of names and requests, sent by logged in user."""
+    return [
+        ("PING", Request(Request.Type.PING)),
+        ("GET_ALL_ITEMS_NAMES", Request(Request.Type.GET_ALL_ITEMS_NAMES)),
+        ("GET_CREDITS", Request(Request.Type.GET_CREDITS)),
+        ("GET_ITEM", Request(Request.Type.GET_ITEM, "hat")),
+        ("USER_HAS", Request(Request.Type.USER_HAS, "hat")),
+        ("PURCHASE_ITEM", Request(Request.Type.PURCHASE_ITEM, ("hat", 1))),
+        ("BATCH(5 x GET_CREDITS)",
+         Request(Request.Type.BATCH, [Request(Request.Type.GET_CREDITS)]*5)),
+    ]
+
+
+def run():
+    """Print the best time of processing of each request."""
+    with TemporaryDirectory() as directory:
+        users_db = UsersDB(create_data_base(directory, "users"))
+        server_core = ServerCore(
+            ItemsDB(create_data_base(directory, "items")),
+            users_db,
+            # Credits are big enough for all purchases.
+            10**9,
+            10**9,
+            Persister(users_db, 10**9, 3600),
+            False
+        )
+        handler = server_core.get_handler()
+        handler.process_request(Request(Request.Type.LOG_IN, "bench"))
+        anonymous = server_core.get_handler()
+
+        cases = [(name, handler, request)
+                 for name, request in sample_requests()]
+        cases.append(("GET_CREDITS, no login", anonymous,
+                      Request(Request.Type.GET_CREDITS)))
+        print(f"{'request':<26}{'ns':>8}")
+        for name, case_handler, request in cases:
+            best = min(repeat(
+                lambda: case_handler.process_request(request),
+                number=NUMBER,
+                repeat=REPEAT
+            ))
+            print(f"{name:<26}{1e9*best/NUMBER:>8.0f}")
+
+
+if __name__ == "__main__":
+    run()
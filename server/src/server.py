@@ -5,27 +5,83 @@ from confighandler import open_config, transform_config
 from item_sqlite_db import ItemsDB
 from user_sqlite_db import UsersDB
 from servercore import ServerCore
+from sessions import SharedSessions
+from persister import Persister
+from metrics import Metrics
+from metricsserver import MetricsServer
+from profiler import Profiler
 from clienthandler import ClientHandler
-from signal import signal, SIGINT
+from asyncclienthandler import AsyncClientHandler
+from os import kill, wait, WIFSIGNALED, _exit
+from os.path import join
+from socket import socket, AF_INET, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR
+from sys import stdout
+from threading import Thread
+from traceback import print_exc
+from signal import signal, SIGINT, SIGTERM, SIG_IGN, SIG_DFL
+try:
+    from signal import SIGHUP
+except ImportError:
+    SIGHUP = None
+try:
+    from os import fork
+except ImportError:
+    fork = None
 
 
 def run():
     """Exec loop of server application."""
     config_must_have = {
         "port": int,
+        "max_frame_size": int,
         "max_init_credits": int,
         "min_init_credits": int,
-        "save_frequency": int,
+        "commit_batch_size": int,
+        "commit_interval": float,
         "simultanious_log_ins": bool,
+        "session_grace": float,
+        "compression_threshold": int,
+        "admin_requests": bool,
         "items_db_path": str,
-        "users_db_path": str
+        "users_db_path": str,
+        "engine": str,
+        "processes": int,
+        "db_workers": int,
+        "db_pool_size": int,
+        "sqlite_pragmas": dict,
+        "users_cache_size": int,
+        "metrics_port": int,
+        "profile_sample_rate": int,
+        "profile_mode": str,
+        "profile_dir": str
     }
     config = open_config("server/cfg/server_config.json")
     if config is None or not transform_config(config, config_must_have):
         return
+    if config["engine"] not in ("threads", "asyncio"):
+        print("Unknown engine:", config["engine"])
+        return
+
+    if config["processes"] > 1:
+        run_workers(config)
+    else:
+        serve(config)
+
 
+def run_workers(config):
+    """Serve clients with several worker processes.
+
+    Workers are forked from this process and accept connections
+    from single listening socket. Each of them has its own ServerCore,
+    while users are shared through SharedSessions.
+    Signals are passed to workers. Crashed workers are restarted.
+    """
+    if fork is None:
+        print("Several processes are not supported on this platform")
+        return
     try:
-        users_db = UsersDB(config["users_db_path"])
+        UsersDB.migrate(config["users_db_path"])
+        SharedSessions.reset(config["users_db_path"])
     except OSError:
         print("Unable to open users data base")
         return
@@ -33,8 +89,128 @@ def run():
         print("Unable to read users data base")
         return
 
+    listener = socket(AF_INET, SOCK_STREAM)
+    listener.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
     try:
-        items_db = ItemsDB(config["items_db_path"])
+        listener.bind(("127.0.0.1", config["port"]))
+    except OSError:
+        print("Unable to listen to port", config["port"])
+        listener.close()
+        return
+    listener.listen(AsyncClientHandler._backlog)
+    listener.setblocking(False)
+
+    workers = dict()
+    stopping = False
+
+    def start_worker(worker):
+        stdout.flush()
+        pid = fork()
+        if pid:
+            workers[pid] = worker
+            return
+        signal(SIGINT, SIG_IGN)
+        signal(SIGTERM, SIG_DFL)
+        if SIGHUP is not None:
+            signal(SIGHUP, SIG_IGN)
+        code = 0
+        try:
+            serve(config, listener, worker)
+        except BaseException:
+            print_exc()
+            code = 1
+        finally:
+            stdout.flush()
+            _exit(code)
+
+    def pass_signal(sig, frame):
+        """Pass signal to workers. Stop them, unless it is SIGHUP."""
+        nonlocal stopping
+        if sig != SIGHUP:
+            stopping = True
+            sig = SIGTERM
+        for pid in workers:
+            try:
+                kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    for worker in range(config["processes"]):
+        start_worker(worker)
+    signal(SIGINT, pass_signal)
+    signal(SIGTERM, pass_signal)
+    if SIGHUP is not None:
+        signal(SIGHUP, pass_signal)
+    print("Online,", len(workers), "processes")
+
+    while workers:
+        pid, status = wait()
+        worker = workers.pop(pid, None)
+        if worker is None:
+            continue
+        SharedSessions.reset(config["users_db_path"], worker)
+        if not stopping and WIFSIGNALED(status):
+            print("Worker", worker, "crashed, restarting")
+            start_worker(worker)
+    listener.close()
+    print("Offline")
+
+
+def serve(config, listener=None, worker=None):
+    """Serve clients in this process.
+
+    listener is optional socket, which is already listening.
+    worker is number of this process, if several processes
+    serve clients. Such process stops on SIGTERM only
+    and serves metrics on metrics_port + worker.
+    Its sessions can't be resumed, since client can reconnect
+    to another process.
+    """
+    metrics = Metrics()
+    profile_dir = config["profile_dir"]
+    if worker is not None:
+        profile_dir = join(profile_dir, f"worker{worker}")
+    try:
+        profiler = Profiler(
+            config["profile_sample_rate"],
+            config["profile_mode"],
+            profile_dir
+        )
+    except ValueError as error:
+        print(error)
+        return
+
+    try:
+        users_db = UsersDB(
+            config["users_db_path"],
+            config["db_pool_size"],
+            config["sqlite_pragmas"],
+            metrics,
+            config["users_cache_size"],
+            exclusive=worker is None
+        )
+        sessions = None
+        if worker is not None:
+            sessions = SharedSessions(
+                config["users_db_path"],
+                worker,
+                config["simultanious_log_ins"],
+                config["sqlite_pragmas"]
+            )
+    except OSError:
+        print("Unable to open users data base")
+        return
+    except ValueError:
+        print("Unable to read users data base")
+        return
+
+    try:
+        items_db = ItemsDB(
+            config["items_db_path"],
+            config["db_pool_size"],
+            config["sqlite_pragmas"],
+            metrics
+        )
     except OSError:
         print("Unable to open users data base")
         return
@@ -42,19 +218,76 @@ def run():
         print("Unable to read users data base")
         return
 
+    persister = Persister(
+        users_db,
+        config["commit_batch_size"],
+        config["commit_interval"]
+    )
     server_core = ServerCore(
         items_db,
         users_db,
         config["min_init_credits"],
         config["max_init_credits"],
-        config["save_frequency"],
-        config["simultanious_log_ins"]
+        persister,
+        config["simultanious_log_ins"],
+        metrics,
+        profiler,
+        sessions,
+        config["session_grace"] if worker is None else 0,
+        config["compression_threshold"],
+        config["admin_requests"]
     )
-    print("Online")
-    ClientHandler(config["port"], server_core).serve_forever()
+    if SIGHUP is not None:
+        signal(SIGHUP, lambda *_: server_core.reload_items())
+
+    if config["engine"] == "asyncio":
+        client_handler = AsyncClientHandler(
+            config["port"],
+            server_core,
+            config["db_workers"],
+            listener,
+            config["max_frame_size"]
+        )
+    else:
+        client_handler = ClientHandler(
+            config["port"],
+            server_core,
+            listener,
+            config["max_frame_size"]
+        )
+
+    def signal_handler(sig, frame):
+        """Handle signal and stop serving clients."""
+        if config["engine"] == "asyncio":
+            client_handler.shutdown()
+        else:
+            raise SystemExit
+
+    if worker is None:
+        signal(SIGINT, signal_handler)
+    signal(SIGTERM, signal_handler)
+    metrics_server = None
+    if config["metrics_port"]:
+        metrics_server = MetricsServer(
+            config["metrics_port"] + (worker or 0),
+            metrics
+        )
+        Thread(target=metrics_server.serve_forever, daemon=True).start()
+
+    persister.start()
+    if worker is None:
+        print("Online")
+    try:
+        client_handler.serve_forever()
+    except SystemExit:
+        pass
+    finally:
+        if metrics_server:
+            metrics_server.shutdown()
+        persister.stop()
+        if worker is None:
+            print("Offline")
 
 
 if __name__ == "__main__":
     run()
-
-# TODO handle interraptions
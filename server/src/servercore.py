@@ -1,7 +1,45 @@
 """Module contains ServerCore class."""
 
+from collections import OrderedDict
 from random import randint
+from secrets import token_urlsafe
+from threading import Lock, Condition, Thread
+from time import monotonic
 from request import Request, Response
+from codec import DEFAULT_CODEC
+from compression import build_zdict, zdict_hash
+from user import User
+from metrics import Metrics
+from profiler import Profiler
+from sessions import LocalSessions
+
+
+class _Route:
+    """The way requests of single type are handled.
+
+    function is called with user and data of request.
+    Session routes are called with _Handler instead of user,
+    since they change state of session.
+    login means request is refused, unless user is logged in.
+    lock means function is called under lock of user.
+    wrap means function returns data, not whole Response.
+    admin means request is refused, unless admin requests are allowed.
+    """
+
+    __slots__ = ("request_type", "function", "session", "login", "lock",
+                 "wrap", "admin")
+
+    def __init__(self, request_type, function,
+                 session=False, login=False, lock=False, wrap=False,
+                 admin=False):
+        """Create route for requests of given type."""
+        self.request_type = request_type
+        self.function = function
+        self.session = session
+        self.login = login or lock
+        self.lock = lock
+        self.wrap = wrap
+        self.admin = admin
 
 
 class ServerCore:
@@ -14,35 +52,103 @@ class ServerCore:
     class _Handler:
         """Class handles clients."""
 
-        def __init__(self, parent):
+        def __init__(self, parent, notify):
             self._parent = parent
+            self._notify = notify
             self._user = None
+            self._token = None
 
         def process_request(self, request):
             """Process request from client and return response."""
-            request_type, data = request.request_type, request.data
-            if request_type is Request.Type.LOG_IN:
-                return self._log_in(data)
-            elif request_type is Request.Type.LOG_OUT:
-                return self._log_out()
-            else:
-                return self._parent.handle_request_from(self._user, request)
+            route = self._parent._route(request.request_type)
+            if route.session:
+                return route.function(self, request.data)
+            return self._parent._handle(route, self._user, request.data)
+
+        def _batch(self, requests):
+            """Process requests one by one and return all responses at once.
+
+            Requests are processed in given order,
+            so each one sees results of previous ones.
+            """
+            request_type = Request.Type.BATCH
+            if requests is None:
+                return Response(
+                    request_type,
+                    success=False,
+                    message="No requests"
+                )
+            if any(r.request_type is request_type for r in requests):
+                return Response(
+                    request_type,
+                    success=False,
+                    message="Nested batches are not allowed"
+                )
+            return Response(
+                request_type,
+                data=[self.process_request(r) for r in requests]
+            )
+
+        def _subscribe(self, _):
+            request_type = Request.Type.SUBSCRIBE
+            if not self._notify:
+                return Response(
+                    request_type,
+                    success=False,
+                    message="Notifications are not supported"
+                )
+            return Response(
+                request_type,
+                data=self._parent.subscribe(self._notify)
+            )
 
         def _log_in(self, user_name):
-            if self._parent.user_is_activated(user_name):
+            if not self._parent.activate_user(user_name):
+                message = "User already online"
+                if not self._parent.user_is_activated(user_name):
+                    message = "User is online in another server process"
                 return Response(
                     Request.Type.LOG_IN,
                     success=False,
-                    message="User already online"
+                    message=message
                 )
-            if user_name not in self._parent.users:
-                self._parent.users.create_user(user_name)
+            if self._user:
+                self._parent.deactivate_user(self._user.name)
+                self._user = None
+            self._token = self._parent.new_token()
+            users = self._parent.users
+            users.pin(user_name)
+            with users.lock_for(user_name):
+                self._user = users.get(user_name)
+                created = self._user is None
+                if created:
+                    self._user = users.create_user(user_name)
+                self._user.credits += self._parent.get_init_credits()
+                self._parent.user_changed(user_name)
+            if created:
+                self._parent.publish(users=[user_name])
+            return Response(Request.Type.LOG_IN, data=self._token)
+
+        def _resume(self, token):
+            """Take over session, left by disconnected client.
+
+            User is still cached and pinned, so nothing is read
+            from data base and no credits are given.
+            """
+            user_name = self._parent.resume(token)
+            if user_name is None:
+                return Response(
+                    Request.Type.RESUME,
+                    success=False,
+                    message="No such session"
+                )
+            if self._user:
+                self._parent.deactivate_user(self._user.name)
             self._user = self._parent.users[user_name]
-            self._user.credits += self._parent.get_init_credits()
-            self._parent.activate_user(user_name)
-            return Response(Request.Type.LOG_IN)
+            self._token = token
+            return Response(Request.Type.RESUME, data=token)
 
-        def _log_out(self):
+        def _log_out(self, _):
             request_type = Request.Type.LOG_OUT
             if not self._user:
                 return Response(
@@ -52,17 +158,31 @@ class ServerCore:
                 )
             self._parent.deactivate_user(self._user.name)
             self._user = None
-            self._parent.users.commit()
+            self._token = None
             return Response(request_type)
 
-        def deactivate_user(self):
+        def disconnect(self):
+            """Park session of user, so client can resume it."""
             if self._user:
-                self._parent.deactivate_user(self._user.name)
+                self._parent.park(self._token, self._user.name)
+                self._user = None
+
+        def unsubscribe(self):
+            if self._notify:
+                self._parent.unsubscribe(self._notify)
+
+    _max_page_size = 1000
 
     def __init__(self, items_db, users_db,
                  min_limit, max_limit,
-                 save_frequency,
-                 simultanious_log_ins):
+                 persister,
+                 simultanious_log_ins,
+                 metrics=None,
+                 profiler=None,
+                 sessions=None,
+                 session_grace=0,
+                 compression_threshold=0,
+                 admin_requests=False):
         """Create ServerCore.
 
         items_db and users_db stands for data bases
@@ -70,11 +190,35 @@ class ServerCore:
 
         min_limit and max_limit are bonds for user initialization reward.
 
-        save_frequency is how many operations must take place between
-        automatic commits. Operations from each user counts.
+        persister is Persister, which commits changes of users_db
+        in background. Changes from each user counts.
 
         simultanious_log_ins is binary flag, which allows or forbide
         multiple users log in into one account simultaniously.
+
+        metrics is Metrics, where statistics of server are collected.
+        New one is created, if it is not given.
+
+        profiler is Profiler, which samples requests.
+        Disabled one is created, if it is not given.
+
+        sessions keeps track of users, who are logged in.
+        LocalSessions are created, if they are not given.
+        SharedSessions must be given, if several server processes
+        share users data base.
+
+        session_grace is time in seconds, during which session
+        of disconnected client is kept, so client can resume it
+        with token, returned on log in. 0 disables it.
+
+        compression_threshold is minimal size of message in bytes,
+        which is compressed, if client supports compression.
+        0 disables compression.
+
+        admin_requests is binary flag, which allows requests,
+        that reveal or change internals of server, such as METRICS
+        and PROFILE.
+        Any client can send them, so they are refused by default.
         """
         self._items = items_db
         self._users = users_db
@@ -82,46 +226,137 @@ class ServerCore:
         self._new_credits_max = max_limit
         self._new_credits_min = min_limit
 
-        self._save_frequency = save_frequency
-        self._operation_count = 1
-
-        self._simultanious_log_ins = simultanious_log_ins
-        self._active_users_names = set()
+        self._persister = persister
+
+        if sessions is None:
+            sessions = LocalSessions(simultanious_log_ins)
+        self._sessions = sessions
+        self._session_grace = session_grace
+        self._parked = OrderedDict()
+        self._parked_users = dict()
+        self._parked_condition = Condition()
+        self._expirer = None
+
+        self._compression_threshold = compression_threshold
+        self._admin_requests = admin_requests
+        self._zdict = None
+        self._zdict_lock = Lock()
+
+        self._metrics = metrics or Metrics()
+        self._profiler = profiler or Profiler()
+        self._metrics.add_source("persister", persister.stats)
+        self._metrics.add_source("users", lambda: {
+            "active": len(self._sessions),
+            "parked": len(self._parked),
+            "subscribed": len(self._subscribers),
+        })
+        self._metrics.add_source("users_cache", users_db.cache_stats)
+        self._metrics.add_source("items", lambda: {
+            "version": self._items.version,
+        })
+
+        self._subscribers = set()
+        self._notifications_lock = Lock()
+        self._delivery_lock = Lock()
+        self._notifications_version = 0
+
+        self._routes = self._compile_routes([
+            _Route(Request.Type.LOG_IN, self._Handler._log_in, session=True),
+            _Route(Request.Type.LOG_OUT, self._Handler._log_out, session=True),
+            _Route(Request.Type.BATCH, self._Handler._batch, session=True),
+            _Route(Request.Type.SUBSCRIBE, self._Handler._subscribe,
+                   session=True),
+            _Route(Request.Type.RESUME, self._Handler._resume, session=True),
+
+            _Route(Request.Type.GET_ALL_USERS,
+                   lambda *_: self._users.values(), wrap=True),
+            _Route(Request.Type.GET_ALL_USERS_NAMES,
+                   lambda *_: self._users.keys(), wrap=True),
+            _Route(Request.Type.GET_ALL_ITEMS,
+                   lambda *_: self._items.values(), wrap=True),
+            _Route(Request.Type.GET_ALL_ITEMS_NAMES,
+                   lambda *_: self._items.keys(), wrap=True),
+            _Route(Request.Type.PING, lambda *_: None, wrap=True),
+            _Route(Request.Type.METRICS,
+                   lambda *_: self._metrics.report(), wrap=True, admin=True),
+
+            _Route(Request.Type.GET_CURRENT_USER,
+                   lambda user, _: self._copy_user(user),
+                   lock=True, wrap=True),
+            _Route(Request.Type.GET_CURRENT_USER_NAME,
+                   lambda user, _: user.name, lock=True, wrap=True),
+            _Route(Request.Type.GET_CREDITS,
+                   lambda user, _: user.credits, lock=True, wrap=True),
+            _Route(Request.Type.GET_USER_ITEMS_NAMES,
+                   lambda user, _: dict(user.items), lock=True, wrap=True),
+            _Route(Request.Type.GET_USER_ITEMS, self._get_user_items,
+                   lock=True, wrap=True),
+
+            _Route(Request.Type.GET_USER, self._get_user),
+            _Route(Request.Type.GET_ITEM, self._get_item),
+            _Route(Request.Type.USER_HAS, self._user_has, login=True),
+            _Route(Request.Type.PURCHASE_ITEM, self._buy_item, login=True),
+            _Route(Request.Type.SELL_ITEM, self._sell_item, login=True),
+            _Route(Request.Type.PURCHASE_ITEMS,
+                   lambda user, lines:
+                       self._trade_items(user, lines, buying=True),
+                   login=True),
+            _Route(Request.Type.SELL_ITEMS,
+                   lambda user, lines:
+                       self._trade_items(user, lines, buying=False),
+                   login=True),
+            _Route(Request.Type.GET_USERS_PAGE, lambda _, cursor:
+                   self._get_page(Request.Type.GET_USERS_PAGE, cursor)),
+            _Route(Request.Type.GET_USERS_NAMES_PAGE, lambda _, cursor:
+                   self._get_page(Request.Type.GET_USERS_NAMES_PAGE, cursor)),
+            _Route(Request.Type.USER_EXISTS,
+                   lambda _, name: name in self._users, wrap=True),
+            _Route(Request.Type.ITEM_EXISTS,
+                   lambda _, name: name in self._items, wrap=True),
+            _Route(Request.Type.PROFILE, self._profile, admin=True),
+            _Route(Request.Type.GET_ITEMS_CHANGES, self._get_items_changes),
+            _Route(Request.Type.NOTIFY, lambda *_:
+                   Response(
+                       Request.Type.NOTIFY,
+                       success=False,
+                       message="Notifications are sent by server only"
+                   )),
+        ])
+
+    def _compile_routes(self, routes):
+        """Get list of routes, indexed by values of request types.
+
+        Every request type must have route.
+        Members of Request.Type hash their names in Python code,
+        so list index is much cheaper than dict lookup.
+        Admin routes are replaced with refusal,
+        unless admin requests are allowed.
+        """
+        ret = [None]*(max(t.value for t in Request.Type) + 1)
+        for route in routes:
+            if route.admin and not self._admin_requests:
+                route = self._disabled_route(route.request_type)
+            ret[route.request_type.value] = route
+        missing = [t.name for t in Request.Type if ret[t.value] is None]
+        if missing:
+            raise ValueError(f"No routes for {', '.join(missing)}")
+        return ret
 
-        self._plain_requests = {
-            Request.Type.GET_ALL_USERS: lambda: self._users.values(),
-            Request.Type.GET_ALL_USERS_NAMES: lambda: self._users.keys(),
-            Request.Type.GET_ALL_ITEMS: lambda: self._items.values(),
-            Request.Type.GET_ALL_ITEMS_NAMES: lambda: self._items.keys(),
-            Request.Type.PING: lambda: None,
-        }
+    def _route(self, request_type):
+        """Get route for requests of given type.
 
-        self._user_requests = {
-            Request.Type.GET_CURRENT_USER: lambda user: user,
-            Request.Type.GET_CURRENT_USER_NAME: lambda user: user.name,
-            Request.Type.GET_CREDITS: lambda user: user.credits,
-            Request.Type.GET_USER_ITEMS_NAMES: lambda user: user.items,
-            Request.Type.GET_USER_ITEMS:
-                lambda user: {item.name: item for item in user.items}
-        }
+        _value_ is plain attribute of enum member,
+        while value is property, which costs even more than hashing.
+        """
+        return self._routes[request_type._value_]
 
-        self._complex_requests = {
-            Request.Type.GET_USER: self._get_user,
-            Request.Type.GET_ITEM: self._get_item,
-            Request.Type.USER_HAS: self._user_has,
-            Request.Type.PURCHASE_ITEM: self._buy_item,
-            Request.Type.SELL_ITEM: self._sell_item,
-            Request.Type.USER_EXISTS: lambda _, name:
-                Response(
-                    Request.Type.USER_EXISTS,
-                    data=(name in self._users)
-                ),
-            Request.Type.ITEM_EXISTS: lambda _, name:
-                Response(
-                    Request.Type.ITEM_EXISTS,
-                    data=(name in self._items)
-                ),
-        }
+    @staticmethod
+    def _disabled_route(request_type):
+        return _Route(request_type, lambda *_: Response(
+            request_type,
+            success=False,
+            message="Request is disabled on this server"
+        ))
 
     @staticmethod
     def _no_user_response(request_type):
@@ -139,75 +374,318 @@ class ServerCore:
             message=f"No such item: {item_name}"
         )
 
+    @staticmethod
+    def _bad_amount_response(request_type, amount):
+        return Response(
+            request_type,
+            success=False,
+            message=f"Can't buy or sell {amount} items"
+        )
+
+    @staticmethod
+    def _copy_user(user):
+        ret = User(user.name)
+        ret.credits = user.credits
+        ret.items.update(user.items)
+        return ret
+
+    @property
+    def metrics(self):
+        """Get Metrics of server."""
+        return self._metrics
+
+    @property
+    def profiler(self):
+        """Get Profiler of server."""
+        return self._profiler
+
     @property
     def users(self):
         """Get users data base."""
         return self._users
 
+    @property
+    def compression_threshold(self):
+        """Get minimal size of compressed message, 0 if it is disabled."""
+        return self._compression_threshold
+
+    def compression_dictionary(self):
+        """Get hash and bytes of dictionary for compression.
+
+        Dictionary is primed with encoded catalogue of items,
+        since item names and prices are repeated in most responses.
+        It is built again, when catalogue changes.
+        """
+        catalogue = self._items.snapshot()
+        with self._zdict_lock:
+            if self._zdict is None or self._zdict[0] is not catalogue:
+                zdict = build_zdict([DEFAULT_CODEC.encode_response(
+                    Response(Request.Type.GET_ALL_ITEMS,
+                             data=catalogue.values())
+                )])
+                self._zdict = (catalogue, zdict_hash(zdict), zdict)
+            return self._zdict[1:]
+
     def activate_user(self, user_name):
         """Mark user by given name as active.
 
-        Works only if simultanious_log_ins is set to False.
+        Parked sessions of user are closed, if they stand in the way.
+        Return False, if user is already active
+        and simultanious_log_ins is set to False,
+        or if user is active in another server process.
         """
-        if not self._simultanious_log_ins:
-            self._active_users_names.add(user_name)
+        if self._sessions.acquire(user_name):
+            return True
+        return self._close_parked(user_name) and \
+            self._sessions.acquire(user_name)
 
     def user_is_activated(self, user_name):
-        """Check if user by given name is marked as active.
-
-        Works only if simultanious_log_ins is set to False.
-        """
-        return not self._simultanious_log_ins and \
-            user_name in self._active_users_names
+        """Check if user by given name is active in this server process."""
+        return user_name in self._sessions
 
     def deactivate_user(self, user_name):
         """Mark user by given name as inactive.
 
-        Works only if simultanious_log_ins is set to False.
+        User can be evicted from users cache afterwards.
+        If sessions are shared with other server processes,
+        changes of user are committed before it is marked inactive,
+        so the next process, which serves user, reads them.
+        """
+        self._users.unpin(user_name)
+        self._persister.flush(wait=self._sessions.shared)
+        self._sessions.release(user_name)
+
+    def new_token(self):
+        """Get new token of session, or None, if sessions can't be resumed."""
+        if self._session_grace <= 0:
+            return None
+        return token_urlsafe(16)
+
+    def park(self, token, user_name):
+        """Keep session of disconnected client for grace period.
+
+        User stays active and cached. Session can be taken over
+        with resume, otherwise user is deactivated after grace period.
+        Without token user is deactivated at once.
+        """
+        if token is None:
+            self.deactivate_user(user_name)
+            return
+        with self._parked_condition:
+            deadline = monotonic() + self._session_grace
+            self._parked[token] = user_name, deadline
+            self._parked_users.setdefault(user_name, set()).add(token)
+            if self._expirer is None:
+                self._expirer = Thread(
+                    target=self._expire_parked,
+                    name="SessionExpirer",
+                    daemon=True
+                )
+                self._expirer.start()
+            self._parked_condition.notify()
+
+    def resume(self, token):
+        """Take parked session with given token.
+
+        Return name of its user, or None, if there is no such session.
+        """
+        with self._parked_condition:
+            parked = self._unpark(token)
+        return None if parked is None else parked[0]
+
+    def _unpark(self, token):
+        parked = self._parked.pop(token, None)
+        if parked is not None:
+            tokens = self._parked_users[parked[0]]
+            tokens.discard(token)
+            if not tokens:
+                del self._parked_users[parked[0]]
+        return parked
+
+    def _close_parked(self, user_name):
+        """Deactivate user of each parked session of given user.
+
+        Return True, if there were any.
+        """
+        with self._parked_condition:
+            tokens = list(self._parked_users.get(user_name, ()))
+            for token in tokens:
+                self._unpark(token)
+        for _ in tokens:
+            self.deactivate_user(user_name)
+        return bool(tokens)
+
+    def _expire_parked(self):
+        """Deactivate users of parked sessions after grace period.
+
+        Grace period is the same for all sessions,
+        so they expire in order, in which they were parked.
+        """
+        while True:
+            with self._parked_condition:
+                while not self._parked:
+                    self._parked_condition.wait()
+                token, (user_name, deadline) = \
+                    next(iter(self._parked.items()))
+                delay = deadline - monotonic()
+                if delay > 0:
+                    self._parked_condition.wait(delay)
+                    continue
+                self._unpark(token)
+            self.deactivate_user(user_name)
+
+    def user_changed(self, user_name, *item_names):
+        """Report change of credits and given items of user.
+
+        Changes are committed by persister later.
         """
-        if not self._simultanious_log_ins:
-            self._active_users_names.remove(user_name)
-        self._users.commit()
+        self._users.mark_dirty(user_name, *item_names)
+        self._persister.notify()
 
     def get_init_credits(self):
         """Get random sum of credits for user initialization."""
         return randint(self._new_credits_min, self._new_credits_max)
 
-    def get_handler(self):
-        """Get handler for new client."""
-        return self._Handler(self)
+    def subscribe(self, notify):
+        """Subscribe to notifications about changes of users and items.
+
+        notify is called with NOTIFY response on each change.
+        Return version of the last notification.
+        """
+        with self._notifications_lock:
+            self._subscribers.add(notify)
+            return self._notifications_version
+
+    def unsubscribe(self, notify):
+        """Stop sending notifications to given subscriber."""
+        with self._notifications_lock:
+            self._subscribers.discard(notify)
+
+    def publish(self, users=(), items=(), removed_items=()):
+        """Notify all subscribers about new users and changed items.
+
+        Each notification gets next version, so subscriber can tell,
+        if it has missed any. Subscribers, which fail, are dropped.
+        notify must not block: subscribers are called outside of lock,
+        which guards them, so subscribing never waits for delivery.
+        Deliveries are ordered by their own lock, so versions
+        reach each subscriber in order.
+        """
+        with self._delivery_lock:
+            with self._notifications_lock:
+                self._notifications_version += 1
+                response = Response(
+                    Request.Type.NOTIFY,
+                    data=(
+                        self._notifications_version,
+                        list(users),
+                        list(items),
+                        list(removed_items)
+                    )
+                )
+                subscribers = list(self._subscribers)
+            failed = []
+            for notify in subscribers:
+                try:
+                    notify(response)
+                except (OSError, RuntimeError):
+                    failed.append(notify)
+        if failed:
+            with self._notifications_lock:
+                self._subscribers.difference_update(failed)
+
+    def reload_items(self):
+        """Read items from data base again and notify about changes."""
+        old = self._items.snapshot()
+        new = self._items.reload()
+        if new is old:
+            return
+        changed, removed = new.changes_from(old)
+        self.publish(items=changed, removed_items=removed)
+
+    def get_handler(self, notify=None):
+        """Get handler for new client.
+
+        notify is called with notifications, if client subscribes.
+        """
+        return self._Handler(self, notify)
 
     def handle_request_from(self, user, request):
-        """Handle request for given user."""
-        request_type = request.request_type
+        """Handle request for given user.
 
-        if request_type in self._plain_requests:
-            ret = Response(
-                request_type,
-                data=self._plain_requests[request_type]()
-            )
-        elif request_type in self._user_requests and not user:
-            ret = self._no_user_response(request_type)
-        elif request_type in self._user_requests:
-            ret = Response(
-                request_type,
-                data=self._user_requests[request_type](user)
-            )
+        Requests, which change session, such as LOG_IN,
+        are handled by _Handler only.
+        """
+        route = self._route(request.request_type)
+        if route.session:
+            raise ValueError(f"{route.request_type.name} needs session")
+        return self._handle(route, user, request.data)
+
+    def _handle(self, route, user, data):
+        if route.login and not user:
+            return self._no_user_response(route.request_type)
+        if route.lock:
+            with self._users.lock_for(user.name):
+                ret = route.function(user, data)
         else:
-            ret = self._complex_requests[request_type](user, request.data)
+            ret = route.function(user, data)
+        if route.wrap:
+            ret = Response(route.request_type, data=ret)
+        return ret
 
-        if ret.success:
-            self._operation_count = \
-                (self._operation_count + 1) % self._save_frequency
-            if self._operation_count == 0:
-                self._users.commit()
+    def _profile(self, user, options):
+        """Control profiler.
 
-        return ret
+        options may contain sample_rate and mode to change,
+        reset flag to drop results and dump flag to write them into files.
+        """
+        request_type = Request.Type.PROFILE
+        options = options or {}
+        try:
+            self._profiler.configure(
+                options.get("sample_rate"),
+                options.get("mode")
+            )
+            if options.get("reset"):
+                self._profiler.reset()
+            files = self._profiler.dump() if options.get("dump") else []
+        except (ValueError, TypeError, OSError) as error:
+            return Response(request_type, success=False, message=str(error))
+        data = self._profiler.state()
+        data["files"] = files
+        return Response(request_type, data=data)
+
+    def _get_items_changes(self, user, digest):
+        """Get changes of items since snapshot with given digest.
+
+        Response contains digest of the current snapshot, flag,
+        which tells that client's snapshot is unknown and all items
+        are sent, new and changed items and names of removed items.
+        """
+        catalogue, items, removed = self._items.changes_since(digest)
+        full = items is None
+        if full:
+            items, removed = list(catalogue.values()), []
+        return Response(
+            Request.Type.GET_ITEMS_CHANGES,
+            data=(catalogue.digest, full, items, removed)
+        )
 
-    def _user_has(self, user, item_name):
-        if not user:
-            return self._no_user_response(Request.Type.USER_HAS)
+    def _get_page(self, request_type, cursor):
+        """Get page of users or their names.
+
+        cursor is a pair of name, after which page starts,
+        and size of page, which is limited by _max_page_size.
+        """
+        after, size = cursor
+        size = min(max(size, 1), self._max_page_size)
+        if request_type is Request.Type.GET_USERS_PAGE:
+            data = self._users.page(after, size)
+        else:
+            data = self._users.page_names(after, size)
+        return Response(request_type, data=data)
 
+    def _user_has(self, user, item_name):
         if not item_name:
             return Response(
                 Request.Type.USER_HAS,
@@ -215,83 +693,165 @@ class ServerCore:
                 message="No item"
             )
 
-        if item_name not in self._items:
+        if self._items.snapshot().get(item_name) is None:
             return self._no_item_response(Request.Type.USER_HAS, item_name)
 
-        if item_name not in user.items:
-            ret = 0
-        else:
-            ret = user.items[item_name]
-        return Response(Request.Type.USER_HAS, data=ret)
+        return Response(
+            Request.Type.USER_HAS,
+            data=user.items.get(item_name, 0)
+        )
+
+    def _get_user_items(self, user, _):
+        """Get items of user, which are still in catalogue."""
+        catalogue = self._items.snapshot()
+        return {
+            name: catalogue[name]
+            for name in user.items
+            if name in catalogue
+        }
 
     def _get_item(self, user, item_name):
-        if item_name not in self._items:
+        item = self._items.snapshot().get(item_name)
+        if item is None:
             return self._no_item_response(Request.Type.GET_ITEM, item_name)
 
-        return Response(
-            Request.Type.GET_ITEM,
-            data=self._items[item_name]
-        )
+        return Response(Request.Type.GET_ITEM, data=item)
 
     def _get_user(self, user, user_name):
-        if user_name not in self._users:
+        found_user = self._users.get(user_name)
+        if found_user is None:
             return Response(
                 Request.Type.GET_USER,
                 success=False,
                 message="No such user"
             )
-        return Response(
-            Request.Type.GET_USER,
-            data=self._users[user_name]
-        )
+        with self._users.lock_for(user_name):
+            found_user = self._copy_user(found_user)
+        return Response(Request.Type.GET_USER, data=found_user)
 
     def _buy_item(self, user, item_name_and_amount):
         item_name, amount = item_name_and_amount
         request_type = Request.Type.PURCHASE_ITEM
-        if not user:
-            return self._no_user_response(request_type)
-
-        if item_name not in self._items:
+        item = self._items.snapshot().get(item_name)
+        if item is None:
             return self._no_item_response(request_type, item_name)
 
-        item = self._items[item_name]
-        if item.buying_price*amount > user.credits:
-            return Response(
-                request_type,
-                success=False,
-                message="Not enough money"
-            )
+        if amount <= 0:
+            return self._bad_amount_response(request_type, amount)
+
+        with self._users.lock_for(user.name):
+            if item.buying_price*amount > user.credits:
+                return Response(
+                    request_type,
+                    success=False,
+                    message="Not enough money"
+                )
 
-        user.credits -= item.buying_price*amount
-        user.items[item_name] = user.items.get(item_name, 0) + amount
-        self._operation_count += 1
+            user.credits -= item.buying_price*amount
+            user.items[item_name] = user.items.get(item_name, 0) + amount
+            self.user_changed(user.name, item_name)
+            data = user.credits, user.items[item_name]
         return Response(
             request_type,
+            data=data,
             message=f"Item(s) bought: {amount} {item_name}")
 
     def _sell_item(self, user, item_name_and_amount):
         item_name, amount = item_name_and_amount
         request_type = Request.Type.SELL_ITEM
-        if not user:
-            return self._no_user_response(request_type)
-
-        if item_name not in self._items:
+        item = self._items.snapshot().get(item_name)
+        if item is None:
             return self._no_item_response(request_type, item_name)
 
-        item = self._items[item_name]
-        if user.items.get(item_name, 0) < amount:
+        if amount <= 0:
+            return self._bad_amount_response(request_type, amount)
+
+        with self._users.lock_for(user.name):
+            if user.items.get(item_name, 0) < amount:
+                return Response(
+                    request_type,
+                    success=False,
+                    message=f"You don't have {amount} {item_name}"
+                )
+
+            user.items[item_name] -= amount
+            if user.items[item_name] == 0:
+                user.items.pop(item_name)
+            user.credits += item.selling_price*amount
+            self.user_changed(user.name, item_name)
+            data = user.credits, user.items.get(item_name, 0)
+        return Response(
+            request_type,
+            data=data,
+            message=f"Item(s) sold: {amount} {item_name}"
+        )
+
+    def _trade_items(self, user, lines, buying):
+        """Buy or sell all lines of order, or none of them.
+
+        All lines are checked against single snapshot of items.
+        Response contains credits of user and result of each line:
+        whether it is valid, message and amount of item user has.
+        """
+        request_type = Request.Type.PURCHASE_ITEMS if buying \
+            else Request.Type.SELL_ITEMS
+        if not lines:
             return Response(
                 request_type,
                 success=False,
-                message=f"You don't have {amount} {item_name}"
+                message="Empty order"
             )
 
-        user.items[item_name] -= amount
-        if user.items[item_name] == 0:
-            user.items.pop(item_name)
-        user.credits += item.selling_price*amount
-        self._operation_count += 1
+        catalogue = self._items.snapshot()
+        with self._users.lock_for(user.name):
+            total, changes, messages = 0, {}, []
+            for item_name, amount in lines:
+                message, price = None, 0
+                change = changes.get(item_name, 0)
+                change += amount if buying else -amount
+                if item_name not in catalogue:
+                    message = f"No such item: {item_name}"
+                elif amount <= 0:
+                    message = f"Can't buy or sell {amount} items"
+                elif buying:
+                    price = catalogue[item_name].buying_price*amount
+                    if total + price > user.credits:
+                        message = "Not enough money"
+                else:
+                    price = catalogue[item_name].selling_price*amount
+                    if user.items.get(item_name, 0) + change < 0:
+                        message = f"You don't have {amount} {item_name}"
+
+                if message is None:
+                    total += price
+                    changes[item_name] = change
+                    verb = "bought" if buying else "sold"
+                    messages.append(
+                        (True, f"Item(s) {verb}: {amount} {item_name}")
+                    )
+                else:
+                    messages.append((False, message))
+
+            success = all(valid for valid, _ in messages)
+            if success:
+                user.credits += -total if buying else total
+                for item_name, change in changes.items():
+                    amount = user.items.get(item_name, 0) + change
+                    if amount:
+                        user.items[item_name] = amount
+                    else:
+                        user.items.pop(item_name, None)
+                self.user_changed(user.name, *changes)
+
+            results = [
+                (valid, message, user.items.get(item_name, 0))
+                for (valid, message), (item_name, _) in zip(messages, lines)
+            ]
+            credits = user.credits
+
         return Response(
             request_type,
-            message=f"Item(s) sold: {amount} {item_name}"
+            success=success,
+            data=(credits, results),
+            message=None if success else "Order rejected"
         )
@@ -0,0 +1,141 @@
+"""Module contains LocalSessions and SharedSessions classes.
+
+They keep track of users, who are logged in,
+so simultanious log ins can be allowed or forbidden.
+"""
+
+from sqlite3 import IntegrityError
+from threading import Lock
+from sqlite_pool import ConnectionPool
+
+
+class LocalSessions:
+    """Sessions of users, served by single server process."""
+
+    shared = False
+
+    def __init__(self, simultanious_log_ins):
+        """Create empty sessions.
+
+        simultanious_log_ins allows several sessions of one user.
+        """
+        self._simultanious_log_ins = simultanious_log_ins
+        self._sessions = dict()
+        self._lock = Lock()
+
+    def __len__(self):
+        """Get number of users, who are logged in."""
+        return len(self._sessions)
+
+    def __contains__(self, user_name):
+        """Check if user with given name is logged in."""
+        return user_name in self._sessions
+
+    def acquire(self, user_name):
+        """Open session of user with given name.
+
+        Return False, if user is logged in already
+        and simultanious log ins are forbidden.
+        """
+        with self._lock:
+            count = self._sessions.get(user_name, 0)
+            if count and not self._simultanious_log_ins:
+                return False
+            self._sessions[user_name] = count + 1
+            return True
+
+    def release(self, user_name):
+        """Close one session of user with given name."""
+        with self._lock:
+            self._release(user_name)
+
+    def _release(self, user_name):
+        count = self._sessions.get(user_name, 0) - 1
+        if count > 0:
+            self._sessions[user_name] = count
+        else:
+            self._sessions.pop(user_name, None)
+        return count <= 0
+
+
+class SharedSessions(LocalSessions):
+    """Sessions of users, served by several server processes.
+
+    Each user can be served by one process at a time,
+    so all changes of user happen in cache of that process.
+    Process owns user from the first session of user till the last one.
+    Owners are stored in sessions table of users data base,
+    which every process can see.
+    If simultanious log ins are allowed, more sessions of user
+    can be opened only in process, which owns user already.
+    Connections are not routed to owners, since user is unknown
+    until log in, so client, which lands in another process,
+    is refused and may reconnect.
+    """
+
+    shared = True
+
+    def __init__(self, path, worker, simultanious_log_ins, pragmas=None):
+        """Open connection to users data base by given path.
+
+        worker is number of process, unique among all processes.
+        Raise OSError if data base can't be opened.
+        """
+        super().__init__(simultanious_log_ins)
+        self._worker = worker
+        self._pool = ConnectionPool(path, 1, pragmas)
+
+    @staticmethod
+    def reset(path, worker=None):
+        """Close sessions of given worker, or of all workers, if it is None.
+
+        Sessions table is created in users data base by UsersDB.
+        Raise OSError if data base can't be opened.
+        """
+        pool = ConnectionPool(path, 1)
+        try:
+            if worker is None:
+                pool.execute("DELETE FROM sessions")
+            else:
+                pool.execute(
+                    "DELETE FROM sessions WHERE worker == ?",
+                    (worker,)
+                )
+        finally:
+            pool.close()
+
+    def acquire(self, user_name):
+        """Open session of user with given name.
+
+        Return False, if user is logged in already in this process
+        and simultanious log ins are forbidden,
+        or if user is logged in in any other process.
+        """
+        with self._lock:
+            count = self._sessions.get(user_name, 0)
+            if not count:
+                try:
+                    self._pool.execute(
+                        "INSERT INTO sessions VALUES (?, ?)",
+                        (user_name, self._worker)
+                    )
+                except IntegrityError:
+                    return False
+            elif not self._simultanious_log_ins:
+                return False
+            self._sessions[user_name] = count + 1
+            return True
+
+    def release(self, user_name):
+        """Close one session of user with given name.
+
+        Other processes can serve user after its last session is closed.
+        Changes of user must be committed by then.
+        """
+        with self._lock:
+            if self._release(user_name):
+                self._pool.execute(
+                    "DELETE FROM sessions \
+                     WHERE user_name == ? AND worker == ?",
+                    (user_name, self._worker)
+                )
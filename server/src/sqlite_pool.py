@@ -0,0 +1,99 @@
+"""Module contains ConnectionPool class.
+
+It is used to share SQLite connections between server threads.
+"""
+
+from contextlib import contextmanager
+from os.path import basename
+from queue import Queue
+from sqlite3 import connect as connect_sqlite, Error as SQLiteError
+from time import perf_counter
+
+
+class ConnectionPool:
+    """Thread-safe pool of persistent connections to SQLite data base.
+
+    Each connection is used by one thread at a time.
+    Connections live as long as pool does, so each of them keeps
+    its own cache of prepared statements.
+    """
+
+    _cached_statements = 256
+
+    def __init__(self, path, size, pragmas=None, metrics=None):
+        """Open size connections to data base by given path.
+
+        pragmas is a dict of PRAGMA names and values, which are applied
+        to each connection, such as {"journal_mode": "WAL"}.
+        metrics is optional Metrics. Time of waiting for connection,
+        time of transactions and number of queries are recorded into it,
+        labeled with name of data base file.
+        Raise OSError if data base can't be opened.
+        """
+        self._path = path
+        self._metrics = metrics
+        self._label = basename(path)
+        self._pragmas = dict(pragmas or {})
+        for name, value in self._pragmas.items():
+            self._check_pragma(name, str(value))
+
+        self._connections = Queue()
+        for _ in range(max(size, 1)):
+            self._connections.put(self._connect())
+
+    @staticmethod
+    def _check_pragma(name, value):
+        value_is_plain = value.isidentifier() or value.lstrip("-").isdigit()
+        if not name.isidentifier() or not value_is_plain:
+            raise ValueError(f"Invalid pragma: {name} = {value}")
+
+    def _connect(self):
+        try:
+            connection = connect_sqlite(
+                self._path,
+                check_same_thread=False,
+                cached_statements=self._cached_statements
+            )
+            for name, value in self._pragmas.items():
+                connection.execute(f"PRAGMA {name} = {value}")
+        except SQLiteError as error:
+            raise OSError(f"Can't open {self._path}") from error
+        return connection
+
+    @contextmanager
+    def connection(self):
+        """Take connection from pool for the time of with block.
+
+        Block is executed as single transaction. It is committed on exit,
+        or rolled back, if exception is raised.
+        """
+        start = perf_counter()
+        connection = self._connections.get()
+        taken = perf_counter()
+        try:
+            with connection:
+                yield connection
+        finally:
+            self._connections.put(connection)
+            if self._metrics:
+                self._metrics.observe("db_wait", taken - start, self._label)
+                self._metrics.observe(
+                    "db_transaction",
+                    perf_counter() - taken,
+                    self._label
+                )
+
+    def execute(self, query, *args):
+        """Execute single query and return all fetched rows."""
+        if self._metrics:
+            self._metrics.increment("db_queries", label=self._label)
+        with self.connection() as connection:
+            return connection.execute(query, *args).fetchall()
+
+    def close(self):
+        """Close all connections.
+
+        Pool can't be used afterwards.
+        """
+        while not self._connections.empty():
+            self._connections.get().close()
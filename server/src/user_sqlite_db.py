@@ -3,72 +3,295 @@
 It is used to read sqlite-based data bases with User.
 """
 
-from sqlite3 import connect as connect_sqlite
+from collections import OrderedDict
+from sqlite3 import Error as SQLiteError
+from threading import Lock
+from sqlite_pool import ConnectionPool
+from lockstripes import LockStripes
 from user import User
 
 
 class UsersDB:
-    """Class handles SQLite-based data base with users."""
+    """Class handles SQLite-based data base with users.
 
-    def __init__(self, path):
-        """Open connection with data base with users.
+    Users are cached in memory and changed there.
+    Whoever changes user must hold lock_for(user.name) while doing it,
+    and must mark it dirty with mark_dirty,
+    so commit writes only what has actually changed.
+
+    Cache keeps at most cache_size users, least recently used ones
+    are evicted first. Users, which are pinned, or which have changes,
+    not written into data base yet, are never evicted.
+    Whoever changes user must pin it first.
+
+    If data base isn't exclusive, that is other processes may change
+    users in it, only pinned users and users with unwritten changes
+    are cached. Other users are read from data base each time.
+
+    Schema of data base is brought up to date on open.
+    Its version is kept in PRAGMA user_version.
+    """
+
+    _lock_stripes = 64
+    _page_size = 500
+
+    # Each migration brings schema to the next version.
+    # Users and their items are clustered by primary key,
+    # so user and all its items are read with single index seek.
+    _migrations = (
+        (
+            "CREATE TABLE new_users ( \
+                 name TEXT PRIMARY KEY, \
+                 credits INT \
+             ) WITHOUT ROWID",
+            "INSERT INTO new_users \
+             SELECT name, credits FROM users WHERE name IS NOT NULL",
+            "DROP TABLE users",
+            "ALTER TABLE new_users RENAME TO users",
+            "CREATE TABLE new_users_items ( \
+                 user_name TEXT, \
+                 item_name TEXT, \
+                 amount INTEGER, \
+                 PRIMARY KEY(user_name, item_name), \
+                 FOREIGN KEY(user_name) REFERENCES users(name) \
+             ) WITHOUT ROWID",
+            "INSERT OR REPLACE INTO new_users_items \
+             SELECT user_name, item_name, amount FROM users_items \
+             WHERE user_name IS NOT NULL AND item_name IS NOT NULL",
+            "DROP TABLE users_items",
+            "ALTER TABLE new_users_items RENAME TO users_items",
+        ),
+        (
+            "CREATE TABLE IF NOT EXISTS sessions ( \
+                 user_name TEXT PRIMARY KEY, \
+                 worker INTEGER \
+             )",
+        ),
+    )
+
+    def __init__(self, path, pool_size=1, pragmas=None, metrics=None,
+                 cache_size=0, exclusive=True):
+        """Open connections with data base with users.
 
         Behaves like dict for the most part.
+        pool_size is number of connections, shared between threads.
+        pragmas is a dict of SQLite PRAGMAs, applied to each connection.
+        metrics is optional Metrics, which gets statistics of queries.
+        cache_size is maximum number of cached users. 0 means no limit.
+        exclusive is set, if no other process changes users in data base.
+        Raise OSError if data base can't be opened,
+        or ValueError if its schema can't be updated.
         """
         self._path = path
+        self._pool = ConnectionPool(path, pool_size, pragmas, metrics)
+        self._migrate(self._pool)
         self._users = dict()
+        self._evictable = OrderedDict()
+        self._locks = LockStripes(self._lock_stripes)
+        self._dirty = dict()
+        self._committing = dict()
+        self._dirty_lock = Lock()
+
+        self._cache_size = cache_size
+        self._exclusive = exclusive
+        self._cache_lock = Lock()
+        self._pins = dict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @classmethod
+    def migrate(cls, path):
+        """Bring schema of data base by given path up to date.
+
+        Raise OSError if data base can't be opened,
+        or ValueError if its schema can't be updated.
+        """
+        pool = ConnectionPool(path, 1)
+        try:
+            cls._migrate(pool)
+        finally:
+            pool.close()
+
+    @classmethod
+    def _migrate(cls, pool):
+        try:
+            with pool.connection() as connection:
+                connection.execute("BEGIN IMMEDIATE")
+                version = connection.execute(
+                    "PRAGMA user_version"
+                ).fetchone()[0]
+                if version >= len(cls._migrations):
+                    return
+                for statements in cls._migrations[version:]:
+                    for statement in statements:
+                        connection.execute(statement)
+                connection.execute(
+                    f"PRAGMA user_version = {len(cls._migrations)}"
+                )
+        except SQLiteError as error:
+            raise ValueError("Can't update schema of users data base") \
+                from error
 
     def _execute(self, query, *args):
-        with connect_sqlite(self._path) as connection:
-            cursor = connection.cursor()
-            cursor.execute(query, *args)
-            ret = cursor.fetchall()
-            return ret
+        return self._pool.execute(query, *args)
+
+    def lock_for(self, user_name):
+        """Get lock, which guards user with given name.
+
+        Users with different names most likely have different locks.
+        Lock is reentrant.
+        """
+        return self._locks[user_name]
 
     def __contains__(self, user_name):
-        """Check if db contains user with given name."""
+        """Check if db contains user with given name.
+
+        Cached users are known to exist without query.
+        """
+        if user_name in self._users:
+            return True
         tuples = self._execute(
-            "SELECT name FROM users WHERE name == ?",
+            "SELECT 1 FROM users WHERE name == ?",
             (user_name,)
         )
         return len(tuples) == 1
 
     def create_user(self, user_name):
-        """Create new user."""
-        self._execute(
-            "INSERT INTO users (name, credits) VALUES (?, ?)",
-            (user_name, 0)
-        )
-        self._users[user_name] = User(user_name)
+        """Create new user and return it."""
+        with self.lock_for(user_name):
+            self._execute(
+                "INSERT INTO users (name, credits) VALUES (?, ?)",
+                (user_name, 0)
+            )
+            user = User(user_name)
+            with self._cache_lock:
+                self._cache(user)
+        self._evict()
+        return user
 
     def __getitem__(self, user_name):
         """Get user with given name.
 
+        Same as get, but raise KeyError if there is no such user.
+        """
+        user = self.get(user_name)
+        if user is None:
+            raise KeyError(user_name)
+        return user
+
+    def get(self, user_name, default=None):
+        """Get user with given name, or default, if there is none.
+
+        Existence of user is checked by the same query, which loads it,
+        so there is no need to check it with in beforehand.
         Also stores user in internal cache, use with caution.
+        Each user is loaded only once, even if requested
+        from several threads at the same time.
         """
-        if user_name in self._users:
-            return self._users[user_name]
+        with self._cache_lock:
+            user = self._users.get(user_name, None)
+            if user is not None:
+                if user_name in self._evictable:
+                    self._evictable.move_to_end(user_name)
+                self._hits += 1
+                return user
 
-        tuples = self._execute(
-            "SELECT name, credits FROM users WHERE name == ?",
-            (user_name,)
-        )
-        if not tuples:
-            raise KeyError
+        with self.lock_for(user_name):
+            with self._cache_lock:
+                user = self._users.get(user_name, None)
+            if user is None:
+                user = self._load(user_name)
+                with self._cache_lock:
+                    self._misses += 1
+                    if user is None:
+                        return default
+                    self._cache(user)
+        self._evict()
+        return user
 
-        user_name, user_credits = tuples[0]
-        user = User(user_name)
-        user.credits = user_credits
-        tuples = self._execute(
-            "SELECT item_name, amount \
-             FROM users_items \
-             WHERE user_name == ?",
+    def pin(self, user_name):
+        """Forbid eviction of user with given name from cache.
+
+        Pins are counted, each of them must be removed with unpin.
+        User doesn't have to be cached yet.
+        """
+        with self._cache_lock:
+            self._pins[user_name] = self._pins.get(user_name, 0) + 1
+            self._evictable.pop(user_name, None)
+
+    def unpin(self, user_name):
+        """Remove one pin of user with given name."""
+        with self._cache_lock:
+            pins = self._pins.get(user_name, 0) - 1
+            if pins > 0:
+                self._pins[user_name] = pins
+            else:
+                self._pins.pop(user_name, None)
+                if user_name in self._users:
+                    self._evictable[user_name] = None
+        self._evict()
+
+    def cache_stats(self):
+        """Get dict with size of cache, number of hits, misses and evictions."""
+        with self._cache_lock:
+            return {
+                "size": len(self._users),
+                "capacity": self._cache_size,
+                "pinned": len(self._pins),
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
+
+    def _cache(self, user):
+        self._users[user.name] = user
+        if user.name not in self._pins:
+            self._evictable[user.name] = None
+
+    def _evict(self):
+        """Evict least recently used users, until cache fits its size.
+
+        Only users, which are not pinned, are candidates. They are kept
+        in LRU order apart from the rest, so pinned users are never
+        walked through. Candidates with unwritten changes are dropped
+        from candidates and come back after commit.
+        If data base isn't exclusive, all other users are evicted.
+        """
+        if self._exclusive and not self._cache_size:
+            return
+        limit = self._cache_size if self._exclusive else 0
+        with self._cache_lock:
+            excess = len(self._users) - limit
+            if excess <= 0:
+                return
+            with self._dirty_lock:
+                dirty, committing = self._dirty, self._committing
+                evicted = 0
+                while evicted < excess and self._evictable:
+                    user_name, _ = self._evictable.popitem(last=False)
+                    if user_name in dirty or user_name in committing:
+                        continue
+                    del self._users[user_name]
+                    evicted += 1
+            self._evictions += evicted
+
+    def _load(self, user_name):
+        rows = self._execute(
+            "SELECT users.credits, users_items.item_name, users_items.amount \
+             FROM users \
+             LEFT JOIN users_items ON users_items.user_name == users.name \
+             WHERE users.name == ?",
             (user_name,)
         )
-        for item_name, amount in tuples:
-            user.items[item_name] = amount
+        if not rows:
+            return None
 
-        self._users[user_name] = user
+        user = User(user_name)
+        user.credits = rows[0][0]
+        for _, item_name, amount in rows:
+            if item_name is not None:
+                user.items[item_name] = amount
         return user
 
     def keys(self):
@@ -78,23 +301,161 @@ class UsersDB:
         return ret
 
     def values(self):
-        """Get list of all users in data base.
+        """Get list of copies of all users in data base.
 
-        Also stores users in internal cache, use with caution.
+        Users are read in pages and aren't stored in internal cache.
         """
-        return [self[name] for name in self.keys()]
+        return [user for page in self.pages() for user in page]
 
-    def commit(self):
-        """Commit changes into data base."""
-        for user_name, user in self._users.items():
-            self._execute(
-                "UPDATE users \
-                 SET credits = ? \
-                 WHERE name == ?",
-                (user.credits, user_name)
+    def pages(self, size=_page_size):
+        """Iterate over copies of all users, ordered by name, in lists.
+
+        Each list is read with single query, see page.
+        """
+        after = None
+        while True:
+            users, after = self.page(after, size)
+            if users:
+                yield users
+            if after is None:
+                return
+
+    def page(self, after=None, size=_page_size):
+        """Get copies of up to size users, whose names follow after.
+
+        Users are ordered by name and read with single joined query.
+        Pass None as after to get the first page.
+        Users, which are cached, are copied from cache,
+        so they include changes, which aren't committed yet.
+        Users, which aren't cached, aren't stored in cache.
+        Return list of users and name to pass as after to get next page.
+        If there is no next page, it is None.
+        """
+        condition = "" if after is None else "WHERE name > ?"
+        args = (size,) if after is None else (after, size)
+        rows = self._execute(
+            f"SELECT page.name, page.credits, \
+                     users_items.item_name, users_items.amount \
+              FROM (SELECT name, credits FROM users {condition} \
+                    ORDER BY name LIMIT ?) AS page \
+              LEFT JOIN users_items ON users_items.user_name == page.name \
+              ORDER BY page.name",
+            args
+        )
+        names, loaded = [], {}
+        for user_name, user_credits, item_name, amount in rows:
+            user = loaded.get(user_name)
+            if user is None:
+                user = loaded[user_name] = User(user_name)
+                user.credits = user_credits
+                names.append(user_name)
+            if item_name is not None:
+                user.items[item_name] = amount
+
+        users = []
+        for user_name in names:
+            cached = self._users.get(user_name)
+            if cached is not None:
+                with self.lock_for(user_name):
+                    users.append(self._copy(cached))
+            else:
+                users.append(loaded[user_name])
+        return users, names[-1] if len(names) == size else None
+
+    def page_names(self, after=None, size=_page_size):
+        """Get up to size users names, which follow after, in order.
+
+        Return list of names and name to pass as after to get next page.
+        If there is no next page, it is None.
+        """
+        if after is None:
+            tuples = self._execute(
+                "SELECT name FROM users ORDER BY name LIMIT ?",
+                (size,)
             )
-            for item_name, amount in user.items.items():
-                self._execute(
+        else:
+            tuples = self._execute(
+                "SELECT name FROM users WHERE name > ? ORDER BY name LIMIT ?",
+                (after, size)
+            )
+        names = [tup[0] for tup in tuples]
+        return names, names[-1] if len(names) == size else None
+
+    @staticmethod
+    def _copy(user):
+        ret = User(user.name)
+        ret.credits = user.credits
+        ret.items.update(user.items)
+        return ret
+
+    def mark_dirty(self, user_name, *item_names):
+        """Mark credits and given items of cached user as changed.
+
+        They will be written into data base on next commit.
+        """
+        with self._dirty_lock:
+            self._dirty.setdefault(user_name, set()).update(item_names)
+
+    def commit(self):
+        """Commit changes into data base.
+
+        Only users and items, marked dirty since last commit, are written.
+        All of them are written in single transaction.
+        Items, which users don't have anymore, are deleted.
+        """
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, dict()
+            self._committing = dirty
+        if not dirty:
+            return
+        try:
+            self._write(dirty)
+        finally:
+            with self._dirty_lock:
+                self._committing = dict()
+        with self._cache_lock:
+            with self._dirty_lock:
+                for user_name in dirty:
+                    if user_name in self._users and \
+                            user_name not in self._pins and \
+                            user_name not in self._dirty and \
+                            user_name not in self._evictable:
+                        self._evictable[user_name] = None
+        self._evict()
+
+    def _write(self, dirty):
+        credits_rows, items_rows, deleted_rows = [], [], []
+        for user_name, item_names in dirty.items():
+            user = self._users[user_name]
+            with self.lock_for(user_name):
+                credits_rows.append((user.credits, user_name))
+                for item_name in item_names:
+                    amount = user.items.get(item_name, 0)
+                    if amount:
+                        items_rows.append((user_name, item_name, amount))
+                    else:
+                        deleted_rows.append((user_name, item_name))
+
+        try:
+            with self._pool.connection() as connection:
+                connection.executemany(
+                    "UPDATE users \
+                     SET credits = ? \
+                     WHERE name == ?",
+                    credits_rows
+                )
+                connection.executemany(
                     "REPLACE INTO users_items VALUES (?, ?, ?)",
-                    (user_name, item_name, amount)
+                    items_rows
+                )
+                connection.executemany(
+                    "DELETE FROM users_items \
+                     WHERE user_name == ? AND item_name == ?",
+                    deleted_rows
                 )
+        except Exception:
+            with self._dirty_lock:
+                for user_name, item_names in dirty.items():
+                    self._dirty.setdefault(user_name, set()) \
+                        .update(item_names)
+            raise
@@ -0,0 +1,137 @@
+"""Benchmark of users data base.
+
+Fills data base of the first schema version with many users,
+whose items are inserted in random order, as real trades would do.
+Then measures its migration and main operations of UsersDB on it:
+loading of users, which aren't cached, check of missing users,
+reading of all users in pages and commit of changed users.
+"""
+
+import addshare
+from os.path import getsize, join
+from random import Random
+from sqlite3 import connect
+from sys import argv
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from user_sqlite_db import UsersDB
+
+USERS = 100000
+ITEMS_PER_USER = 10
+ITEMS = 100
+LOOKUPS = 20000
+COMMITTED = 2000
+PRAGMAS = {"journal_mode": "WAL", "synchronous": "NORMAL"}
+
+# Schema before UsersDB started to migrate data base.
+_FIRST_SCHEMA = """
+CREATE TABLE users (
+    name TEXT PRIMARY KEY,
+    credits INT
+);
+CREATE TABLE users_items (
+    user_name TEXT,
+    item_name TEXT,
+    amount INTEGER,
+    FOREIGN KEY(user_name) REFERENCES users(name),
+    UNIQUE(user_name, item_name)
+);
+"""
+
+
+def fill(path, users, items_per_user):
+    """Create data base of the first schema version with given users."""
+    random = Random(0)
+    connection = connect(path)
+    connection.executescript(_FIRST_SCHEMA)
+    connection.executemany(
+        "INSERT INTO users VALUES (?, ?)",
+        ((f"user{n:06d}", n) for n in range(users))
+    )
+    rows = [
+        (f"user{n:06d}", f"item{item:03d}", item + 1)
+        for n in range(users)
+        for item in random.sample(range(ITEMS), items_per_user)
+    ]
+    random.shuffle(rows)
+    connection.executemany("INSERT INTO users_items VALUES (?, ?, ?)", rows)
+    connection.commit()
+    connection.close()
+
+
+def best_time(function, repeat=3):
+    """Get the best time in seconds of several calls of function."""
+    ret = None
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        duration = perf_counter() - start
+        ret = duration if ret is None else min(ret, duration)
+    return ret
+
+
+def run():
+    """Run benchmark and print time of each operation.
+
+    Data base is created in temporary directory,
+    or in directory, given as argument.
+    """
+    with TemporaryDirectory() as temporary:
+        path = join(argv[1] if len(argv) > 1 else temporary, "users.db")
+        start = perf_counter()
+        fill(path, USERS, ITEMS_PER_USER)
+        print(
+            f"{USERS} users with {ITEMS_PER_USER} items each "
+            f"filled in {perf_counter() - start:.1f} s, "
+            f"{getsize(path)/1e6:.1f} MB"
+        )
+        start = perf_counter()
+        UsersDB.migrate(path)
+        print(f"migration took {perf_counter() - start:.1f} s")
+
+        # Not exclusive data base doesn't cache users, which aren't pinned,
+        # so each of them is read from data base.
+        users = UsersDB(path, 1, PRAGMAS, exclusive=False)
+        random = Random(1)
+        names = [f"user{random.randrange(USERS):06d}"
+                 for _ in range(LOOKUPS)]
+
+        def log_in_path():
+            for name in names:
+                users.get(name)
+
+        def missing():
+            for number in range(LOOKUPS):
+                f"nobody{number}" in users
+
+        def pages():
+            for page in users.pages():
+                pass
+
+        print(f"{'operation':<30}{'us':>9}")
+        for name, function, count in (
+            ("get, not cached", log_in_path, LOOKUPS),
+            ("contains, missing user", missing, LOOKUPS),
+            ("pages, per user", pages, USERS),
+        ):
+            print(f"{name:<30}{1e6*best_time(function)/count:>9.1f}")
+
+        users = UsersDB(path, 1, PRAGMAS)
+        committed = [users[name] for name in names[:COMMITTED]]
+
+        def commit():
+            for user in committed:
+                user.credits += 1
+                item_name = next(iter(user.items))
+                user.items[item_name] += 1
+                users.mark_dirty(user.name, item_name)
+            users.commit()
+
+        print(
+            f"{'commit, per user':<30}"
+            f"{1e6*best_time(commit)/len(committed):>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    run()
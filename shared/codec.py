@@ -0,0 +1,518 @@
+"""Module contains codecs, used to pass Requests and Responses over network.
+
+BinaryCodec is schema-driven: each request type has fixed layout of data
+for request and for response. Enums go on the wire as small ints,
+Items and Users go as fixed tuples of fields.
+Nothing but plain data is ever constructed while decoding,
+so it is safe to decode messages from untrusted sockets.
+
+Codec is negotiated at connect time with PING request,
+which data contains "codecs" - list of names of codecs, client supports,
+in order of preference. Until then both sides use DEFAULT_CODEC.
+"""
+
+from struct import Struct, error as StructError
+from request import Request, Response
+from item import Item
+from user import User
+
+
+class _Field:
+    """Base class for layouts of values."""
+
+    def encode(self, value, out):
+        """Append encoded value to bytearray out."""
+        raise NotImplementedError
+
+    def decode(self, data, offset):
+        """Decode value from data, starting at offset.
+
+        Return value and offset of the next field.
+        """
+        raise NotImplementedError
+
+
+class _Nothing(_Field):
+    """Layout of value, which is never sent. Decoded as None."""
+
+    def encode(self, value, out):
+        pass
+
+    def decode(self, data, offset):
+        return None, offset
+
+
+class _Struct(_Field):
+    """Layout of value with fixed size."""
+
+    def __init__(self, fmt):
+        self._struct = Struct(fmt)
+
+    def encode(self, value, out):
+        out += self._struct.pack(value)
+
+    def decode(self, data, offset):
+        return self._struct.unpack_from(data, offset)[0], \
+            offset + self._struct.size
+
+
+_BYTE = _Struct("!B")
+_BOOL = _Struct("!?")
+_INT = _Struct("!q")
+_FLOAT = _Struct("!d")
+_LENGTH = _Struct("!I")
+_LENGTH_STRUCT = Struct("!I")
+_PRICES_STRUCT = Struct("!qq")
+
+
+class _Bytes(_Field):
+    """Layout of bytes, prefixed with length."""
+
+    def encode(self, value, out):
+        _LENGTH.encode(len(value), out)
+        out += value
+
+    def decode(self, data, offset):
+        length, offset = _LENGTH.decode(data, offset)
+        end = offset + length
+        if end > len(data):
+            raise ValueError("Message is truncated")
+        return bytes(data[offset:end]), end
+
+
+class _Str(_Field):
+    """Layout of utf-8 string, prefixed with length."""
+
+    def encode(self, value, out):
+        value = value.encode()
+        out += _LENGTH_STRUCT.pack(len(value))
+        out += value
+
+    def decode(self, data, offset):
+        length, = _LENGTH_STRUCT.unpack_from(data, offset)
+        offset += 4
+        end = offset + length
+        if end > len(data):
+            raise ValueError("Message is truncated")
+        return str(data[offset:end], "utf-8"), end
+
+
+_STR = _Str()
+
+
+class _Optional(_Field):
+    """Layout of value, which may be None."""
+
+    def __init__(self, field):
+        self._field = field
+
+    def encode(self, value, out):
+        if value is None:
+            out.append(0)
+        else:
+            out.append(1)
+            self._field.encode(value, out)
+
+    def decode(self, data, offset):
+        present, offset = _BOOL.decode(data, offset)
+        if not present:
+            return None, offset
+        return self._field.decode(data, offset)
+
+
+def _decode_count(data, offset):
+    """Decode number of elements of list or dict.
+
+    Each element takes at least one byte, so number, which is bigger
+    than rest of message, is rejected before anything is allocated.
+    """
+    count, offset = _LENGTH.decode(data, offset)
+    if count > len(data) - offset:
+        raise ValueError("Message is truncated")
+    return count, offset
+
+
+class _List(_Field):
+    """Layout of list of values of the same layout."""
+
+    def __init__(self, field):
+        self._field = field
+
+    def encode(self, value, out):
+        _LENGTH.encode(len(value), out)
+        encode = self._field.encode
+        for element in value:
+            encode(element, out)
+
+    def decode(self, data, offset):
+        length, offset = _decode_count(data, offset)
+        decode = self._field.decode
+        ret = []
+        for _ in range(length):
+            element, offset = decode(data, offset)
+            ret.append(element)
+        return ret, offset
+
+
+class _Tuple(_Field):
+    """Layout of tuple with fixed fields."""
+
+    def __init__(self, *fields):
+        self._fields = fields
+
+    def encode(self, value, out):
+        if len(value) != len(self._fields):
+            raise ValueError("Unexpected number of fields")
+        for field, element in zip(self._fields, value):
+            field.encode(element, out)
+
+    def decode(self, data, offset):
+        ret = []
+        for field in self._fields:
+            element, offset = field.decode(data, offset)
+            ret.append(element)
+        return tuple(ret), offset
+
+
+class _Dict(_Field):
+    """Layout of dict with keys and values of fixed layouts."""
+
+    def __init__(self, key_field, value_field):
+        self._key_field, self._value_field = key_field, value_field
+
+    def encode(self, value, out):
+        _LENGTH.encode(len(value), out)
+        for key, element in value.items():
+            self._key_field.encode(key, out)
+            self._value_field.encode(element, out)
+
+    def decode(self, data, offset):
+        length, offset = _decode_count(data, offset)
+        ret = {}
+        for _ in range(length):
+            key, offset = self._key_field.decode(data, offset)
+            ret[key], offset = self._value_field.decode(data, offset)
+        return ret, offset
+
+
+class _Item(_Field):
+    """Layout of Item: name, buying price and selling price.
+
+    It is the most common value on the wire, so it is packed by hand.
+    """
+
+    def encode(self, value, out):
+        _STR.encode(value.name, out)
+        out += _PRICES_STRUCT.pack(value.buying_price, value.selling_price)
+
+    def decode(self, data, offset):
+        name, offset = _STR.decode(data, offset)
+        buying_price, selling_price = _PRICES_STRUCT.unpack_from(data, offset)
+        return Item(name, buying_price, selling_price), offset + 16
+
+
+class _User(_Field):
+    """Layout of User: name, credits and items with amounts."""
+
+    _fields = _Tuple(_STR, _INT, _Dict(_STR, _INT))
+
+    def encode(self, value, out):
+        self._fields.encode((value.name, value.credits, value.items), out)
+
+    def decode(self, data, offset):
+        (name, credits, items), offset = self._fields.decode(data, offset)
+        user = User(name)
+        user.credits = credits
+        user.items.update(items)
+        return user, offset
+
+
+_ITEM = _Item()
+_USER = _User()
+
+
+class _Value(_Field):
+    """Layout of value of any supported type, prefixed with its tag.
+
+    Used where data has no fixed layout, such as negotiation options.
+    """
+
+    def __init__(self):
+        self._fields = [
+            (type(None), _Nothing()),
+            (bool, _BOOL),
+            (int, _INT),
+            (float, _FLOAT),
+            (str, _STR),
+            (bytes, _Bytes()),
+            (list, _List(self)),
+            (tuple, _List(self)),
+            (dict, _Dict(self, self)),
+            (Item, _ITEM),
+            (User, _USER),
+        ]
+        self._tags = {
+            value_type: tag
+            for tag, (value_type, _) in enumerate(self._fields)
+        }
+
+    def encode(self, value, out):
+        tag = self._tags.get(type(value), None)
+        if tag is None:
+            raise ValueError(f"Can't encode {type(value)}")
+        out.append(tag)
+        self._fields[tag][1].encode(value, out)
+
+    def decode(self, data, offset):
+        tag, offset = _BYTE.decode(data, offset)
+        if tag >= len(self._fields):
+            raise ValueError(f"Unknown tag: {tag}")
+        value_type, field = self._fields[tag]
+        value, offset = field.decode(data, offset)
+        if value_type is tuple:
+            value = tuple(value)
+        return value, offset
+
+
+_VALUE = _Value()
+_NOTHING = _Nothing()
+_TRADE = _Tuple(_STR, _INT)
+_CURSOR = _Tuple(_Optional(_STR), _INT)
+_ORDER_RESULT = _Tuple(_INT, _List(_Tuple(_BOOL, _STR, _INT)))
+_MESSAGE = _Optional(_STR)
+_DECODING_ERRORS = (
+    IndexError,
+    TypeError,
+    UnicodeDecodeError,
+    RecursionError,
+    StructError
+)
+
+
+_ID = _Optional(_Struct("!I"))
+_TYPES = {request_type.value: request_type for request_type in Request.Type}
+
+
+def _decode_type(data, offset):
+    value, offset = _BYTE.decode(data, offset)
+    if value not in _TYPES:
+        raise ValueError(f"Unknown request type: {value}")
+    return _TYPES[value], offset
+
+
+class _Request(_Field):
+    """Layout of Request: type, optional id and data.
+
+    Layout of data depends on request type.
+    """
+
+    def __init__(self):
+        self.layouts = {}
+
+    def encode(self, value, out):
+        request_type = value.request_type
+        out.append(request_type.value)
+        _ID.encode(value.request_id, out)
+        self.layouts[request_type].encode(value.data, out)
+
+    def decode(self, data, offset):
+        request_type, offset = _decode_type(data, offset)
+        request_id, offset = _ID.decode(data, offset)
+        request_data, offset = self.layouts[request_type].decode(data, offset)
+        return Request(request_type, request_data, request_id), offset
+
+
+class _Response(_Field):
+    """Layout of Response: type, optional id, success flag, message and data.
+
+    Layout of data depends on request type.
+    """
+
+    def __init__(self):
+        self.layouts = {}
+
+    def encode(self, value, out):
+        request_type = value.request_type
+        out.append(request_type.value)
+        _ID.encode(value.request_id, out)
+        _BOOL.encode(value.success, out)
+        _MESSAGE.encode(value.message, out)
+        self.layouts[request_type].encode(value.data, out)
+
+    def decode(self, data, offset):
+        request_type, offset = _decode_type(data, offset)
+        request_id, offset = _ID.decode(data, offset)
+        success, offset = _BOOL.decode(data, offset)
+        message, offset = _MESSAGE.decode(data, offset)
+        response_data, offset = self.layouts[request_type].decode(
+            data,
+            offset
+        )
+        return Response(
+            request_type,
+            success=success,
+            data=response_data,
+            message=message,
+            request_id=request_id
+        ), offset
+
+
+def _optional_layouts(layouts):
+    return {
+        request_type: _Optional(layout)
+        for request_type, layout in layouts.items()
+    }
+
+
+_REQUEST = _Request()
+_RESPONSE = _Response()
+
+_REQUEST.layouts.update({
+    Request.Type.USER_EXISTS: _STR,
+    Request.Type.GET_USER: _STR,
+    Request.Type.GET_ALL_USERS: _NOTHING,
+    Request.Type.GET_ALL_USERS_NAMES: _NOTHING,
+
+    Request.Type.ITEM_EXISTS: _STR,
+    Request.Type.GET_ITEM: _STR,
+    Request.Type.GET_ALL_ITEMS: _NOTHING,
+    Request.Type.GET_ALL_ITEMS_NAMES: _NOTHING,
+
+    Request.Type.GET_CURRENT_USER: _NOTHING,
+    Request.Type.GET_CURRENT_USER_NAME: _NOTHING,
+    Request.Type.GET_CREDITS: _NOTHING,
+
+    Request.Type.USER_HAS: _STR,
+    Request.Type.GET_USER_ITEMS: _NOTHING,
+    Request.Type.GET_USER_ITEMS_NAMES: _NOTHING,
+
+    Request.Type.PING: _Dict(_STR, _VALUE),
+    Request.Type.LOG_IN: _STR,
+    Request.Type.PURCHASE_ITEM: _TRADE,
+    Request.Type.SELL_ITEM: _TRADE,
+    Request.Type.LOG_OUT: _NOTHING,
+    Request.Type.BATCH: _List(_REQUEST),
+    Request.Type.SUBSCRIBE: _NOTHING,
+    Request.Type.NOTIFY: _NOTHING,
+    Request.Type.METRICS: _NOTHING,
+    Request.Type.PROFILE: _Dict(_STR, _VALUE),
+    Request.Type.PURCHASE_ITEMS: _List(_TRADE),
+    Request.Type.SELL_ITEMS: _List(_TRADE),
+    Request.Type.GET_USERS_PAGE: _CURSOR,
+    Request.Type.GET_USERS_NAMES_PAGE: _CURSOR,
+    Request.Type.RESUME: _STR,
+    Request.Type.GET_ITEMS_CHANGES: _STR,
+})
+# Data may be None only in requests, which handlers expect it.
+# Data of other requests is required, so decoding rejects None.
+_REQUEST.layouts.update(_optional_layouts({
+    request_type: layout
+    for request_type, layout in _REQUEST.layouts.items()
+    if layout is _NOTHING or request_type in (
+        Request.Type.PING,
+        Request.Type.BATCH,
+        Request.Type.PROFILE,
+    )
+}))
+
+_RESPONSE.layouts.update(_optional_layouts({
+    Request.Type.USER_EXISTS: _BOOL,
+    Request.Type.GET_USER: _USER,
+    Request.Type.GET_ALL_USERS: _List(_USER),
+    Request.Type.GET_ALL_USERS_NAMES: _List(_STR),
+
+    Request.Type.ITEM_EXISTS: _BOOL,
+    Request.Type.GET_ITEM: _ITEM,
+    Request.Type.GET_ALL_ITEMS: _List(_ITEM),
+    Request.Type.GET_ALL_ITEMS_NAMES: _List(_STR),
+
+    Request.Type.GET_CURRENT_USER: _USER,
+    Request.Type.GET_CURRENT_USER_NAME: _STR,
+    Request.Type.GET_CREDITS: _INT,
+
+    Request.Type.USER_HAS: _INT,
+    Request.Type.GET_USER_ITEMS: _Dict(_STR, _ITEM),
+    Request.Type.GET_USER_ITEMS_NAMES: _Dict(_STR, _INT),
+
+    Request.Type.PING: _Dict(_STR, _VALUE),
+    Request.Type.LOG_IN: _STR,
+    Request.Type.PURCHASE_ITEM: _Tuple(_INT, _INT),
+    Request.Type.SELL_ITEM: _Tuple(_INT, _INT),
+    Request.Type.LOG_OUT: _NOTHING,
+    Request.Type.BATCH: _List(_RESPONSE),
+    Request.Type.SUBSCRIBE: _INT,
+    Request.Type.NOTIFY: _Tuple(_INT, _List(_STR), _List(_ITEM), _List(_STR)),
+    Request.Type.METRICS: _Dict(_STR, _VALUE),
+    Request.Type.PROFILE: _Dict(_STR, _VALUE),
+    Request.Type.PURCHASE_ITEMS: _ORDER_RESULT,
+    Request.Type.SELL_ITEMS: _ORDER_RESULT,
+    Request.Type.GET_USERS_PAGE: _Tuple(_List(_USER), _Optional(_STR)),
+    Request.Type.GET_USERS_NAMES_PAGE: _Tuple(_List(_STR), _Optional(_STR)),
+    Request.Type.RESUME: _STR,
+    Request.Type.GET_ITEMS_CHANGES:
+        _Tuple(_STR, _BOOL, _List(_ITEM), _List(_STR)),
+}))
+
+
+class BinaryCodec:
+    """Compact schema-driven codec.
+
+    Request consists of type, optional id and data.
+    Response consists of type, optional id, success flag,
+    optional message and data.
+    Layout of data depends on request type.
+    """
+
+    name = "binary"
+
+    def encode_request(self, request):
+        """Get bytes of request."""
+        out = bytearray()
+        _REQUEST.encode(request, out)
+        return bytes(out)
+
+    def decode_request(self, data):
+        """Get request from bytes.
+
+        Raise ValueError if data is malformed.
+        """
+        return self._decode(_REQUEST, data)
+
+    def encode_response(self, response):
+        """Get bytes of response."""
+        out = bytearray()
+        _RESPONSE.encode(response, out)
+        return bytes(out)
+
+    def decode_response(self, data):
+        """Get response from bytes.
+
+        Raise ValueError if data is malformed.
+        """
+        return self._decode(_RESPONSE, data)
+
+    @staticmethod
+    def _decode(field, data):
+        try:
+            ret, offset = field.decode(data, 0)
+        except _DECODING_ERRORS as error:
+            raise ValueError("Malformed message") from error
+        if offset != len(data):
+            raise ValueError("Unexpected bytes at the end of message")
+        return ret
+
+
+DEFAULT_CODEC = BinaryCodec()
+
+CODECS = {codec.name: codec for codec in [DEFAULT_CODEC]}
+
+
+def choose_codec(offered_names):
+    """Get first of offered codecs, which is known.
+
+    If there is none, DEFAULT_CODEC is used.
+    """
+    for name in offered_names:
+        if name in CODECS:
+            return CODECS[name]
+    return DEFAULT_CODEC
@@ -0,0 +1,114 @@
+"""Module contains CompressedCodec.
+
+It compresses messages of other codec with zlib, using preset dictionary.
+Compression is negotiated at connect time with PING request, same as codec.
+Client adds "compression" - list of supported methods, and "zdict_hash" -
+hash of dictionary it already has. Server answers with chosen method,
+threshold, hash of its dictionary and, if client doesn't have it yet,
+the dictionary itself, compressed.
+"""
+
+from hashlib import sha1
+from zlib import compressobj, decompressobj, error as ZlibError
+
+COMPRESSION = "zlib"
+MAX_ZDICT_SIZE = 32*1024
+
+_RAW = 0
+_ZLIB = 1
+
+
+def build_zdict(samples):
+    """Get dictionary, primed with given samples of messages.
+
+    Samples are bytes. The last of them are the most valuable,
+    since zlib finds strings at the end of dictionary faster.
+    Dictionary is cut to size of zlib window.
+    """
+    return b"".join(samples)[-MAX_ZDICT_SIZE:]
+
+
+def zdict_hash(zdict):
+    """Get hash, which identifies dictionary."""
+    return sha1(zdict).hexdigest()
+
+
+class CompressedCodec:
+    """Codec, which compresses messages of wrapped codec.
+
+    Each message is prefixed with one byte, which tells if it is
+    compressed. Messages shorter than threshold, and messages,
+    which don't get shorter, are sent as they are.
+    Both sides must use the same dictionary.
+    Decompressed message can't be bigger than max_size,
+    so small message can't inflate into huge one.
+    """
+
+    def __init__(self, codec, threshold, zdict=b"", level=6,
+                 max_size=256*1024*1024):
+        """Wrap codec.
+
+        threshold is minimal size of message in bytes to be compressed.
+        zdict is preset dictionary, see build_zdict.
+        """
+        self.name = codec.name
+        self._codec = codec
+        self._threshold = threshold
+        self._zdict = zdict
+        self._level = level
+        self._max_size = max_size
+
+    def encode_request(self, request):
+        """Get bytes of request."""
+        return self._compress(self._codec.encode_request(request))
+
+    def decode_request(self, data):
+        """Get request from bytes.
+
+        Raise ValueError if data is malformed.
+        """
+        return self._codec.decode_request(self._decompress(data))
+
+    def encode_response(self, response):
+        """Get bytes of response."""
+        return self._compress(self._codec.encode_response(response))
+
+    def decode_response(self, data):
+        """Get response from bytes.
+
+        Raise ValueError if data is malformed.
+        """
+        return self._codec.decode_response(self._decompress(data))
+
+    def _compress(self, payload):
+        if len(payload) >= self._threshold:
+            if self._zdict:
+                compressor = compressobj(self._level, zdict=self._zdict)
+            else:
+                compressor = compressobj(self._level)
+            data = compressor.compress(payload) + compressor.flush()
+            if len(data) < len(payload):
+                return bytes((_ZLIB,)) + data
+        return bytes((_RAW,)) + payload
+
+    def _decompress(self, data):
+        if not data:
+            raise ValueError("Message is empty")
+        flag, data = data[0], memoryview(data)[1:]
+        if flag == _RAW:
+            return data
+        if flag != _ZLIB:
+            raise ValueError(f"Unknown compression flag: {flag}")
+        try:
+            if self._zdict:
+                decompressor = decompressobj(zdict=self._zdict)
+            else:
+                decompressor = decompressobj()
+            payload = decompressor.decompress(data, self._max_size)
+        except ZlibError as error:
+            raise ValueError("Malformed compressed message") from error
+        if decompressor.unconsumed_tail:
+            raise ValueError("Message is too big")
+        if not decompressor.eof:
+            raise ValueError("Compressed message is truncated")
+        return payload
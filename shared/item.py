@@ -2,7 +2,12 @@
 
 
 class Item:
-    """Item object contains item name and its price."""
+    """Item object contains item name and its price.
+
+    Items are created by thousands, so they have no __dict__.
+    """
+
+    __slots__ = ("_name", "_buying_price", "_selling_price")
 
     def __init__(self, name, buying_price, selling_price):
         """Create new item."""
@@ -4,7 +4,12 @@ from enum import Enum
 
 
 class Request:
-    """Request, which is used to pass info from client to server."""
+    """Request, which is used to pass info from client to server.
+
+    Requests are created for every message, so they have no __dict__.
+    """
+
+    __slots__ = ("_type", "_data", "_request_id")
 
     class Type(Enum):
         """Enum, which contains commands."""
@@ -37,10 +42,27 @@ class Request:
         PURCHASE_ITEM = 16
         SELL_ITEM = 17
         LOG_OUT = 18
-
-    def __init__(self, request_type, data=None):
-        """Create new request."""
+        BATCH = 19
+        SUBSCRIBE = 20
+        NOTIFY = 21
+        METRICS = 22
+        PROFILE = 23
+        PURCHASE_ITEMS = 24
+        SELL_ITEMS = 25
+        GET_USERS_PAGE = 26
+        GET_USERS_NAMES_PAGE = 27
+        RESUME = 28
+        GET_ITEMS_CHANGES = 29
+
+    def __init__(self, request_type, data=None, request_id=None):
+        """Create new request.
+
+        request_id is optional. Response to request has the same id.
+        It is used to match responses, when several requests are
+        sent without waiting for responses.
+        """
         self._type, self._data = request_type, data
+        self._request_id = request_id
 
     @property
     def request_type(self):
@@ -52,13 +74,26 @@ class Request:
         """Get data."""
         return self._data
 
+    @property
+    def request_id(self):
+        """Get id of request."""
+        return self._request_id
+
+    @request_id.setter
+    def request_id(self, val):
+        self._request_id = val
+
 
 class Response(Request):
     """Response, that is used to pass info from server to client."""
 
-    def __init__(self, request_type, success=True, data=None, message=None):
+    __slots__ = ("_success", "_message")
+
+    def __init__(self, request_type, success=True, data=None, message=None,
+                 request_id=None):
         """Create new response."""
-        super().__init__(request_type, data)
+        self._type, self._data = request_type, data
+        self._request_id = request_id
         self._success = success
         self._message = message
 
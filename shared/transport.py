@@ -0,0 +1,144 @@
+"""Module contains framing, used to pass messages over TCP.
+
+Each message on the wire is preceded by fixed-size header,
+which contains length of the message in bytes.
+Both server and client use it, so message boundaries never depend on
+how TCP splits or coalesces data.
+There are blocking and asyncio-based readers of frames.
+"""
+
+from asyncio import IncompleteReadError
+from select import select
+from struct import Struct
+from threading import Lock
+
+HEADER = Struct("!I")
+MAX_FRAME_SIZE = 2**32 - 1
+
+
+def pack_frame(payload):
+    """Get frame, ready to be sent, for given payload."""
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ValueError("Message is too big to be framed")
+    return HEADER.pack(len(payload)) + payload
+
+
+class FramedSocket:
+    """Buffered reader and writer of frames over blocking socket.
+
+    Small frames are read through internal buffer,
+    so several frames can be taken from one recv call.
+    Storage of frames bigger than buffer grows as their data arrives,
+    so header alone never makes much memory allocated.
+    Frames can be sent from several threads at once.
+    """
+
+    def __init__(self, sock, buffer_size=64*1024,
+                 max_frame_size=MAX_FRAME_SIZE):
+        """Wrap connected socket.
+
+        Frames bigger than max_frame_size are not received.
+        """
+        self._socket = sock
+        self._max_frame_size = max_frame_size
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start, self._end = 0, 0
+        self._send_lock = Lock()
+
+    @property
+    def socket(self):
+        """Get wrapped socket."""
+        return self._socket
+
+    def send(self, payload):
+        """Send payload as a single frame."""
+        frame = pack_frame(payload)
+        with self._send_lock:
+            self._socket.sendall(frame)
+
+    def has_data(self):
+        """Check if there is data to read without blocking."""
+        if self._end > self._start:
+            return True
+        return bool(select([self._socket], [], [], 0)[0])
+
+    def recv(self):
+        """Receive payload of next frame.
+
+        Return None, if connection has been closed between frames.
+        Raise ConnectionError, if it has been closed in the middle of one,
+        or if frame is bigger than max_frame_size.
+        """
+        header = self._read_exactly(HEADER.size)
+        if header is None:
+            return None
+        length, = HEADER.unpack(header)
+        _check_length(length, self._max_frame_size)
+        payload = self._read_exactly(length)
+        if payload is None:
+            raise ConnectionError("Connection closed in the middle of frame")
+        return payload
+
+    def _read_exactly(self, size):
+        available = self._end - self._start
+        if available >= size:
+            ret = bytes(self._view[self._start:self._start + size])
+            self._start += size
+            return ret
+
+        if size > len(self._buffer):
+            return self._read_big(size)
+
+        self._view[:available] = self._view[self._start:self._end]
+        self._start, self._end = 0, available
+        while self._end < size:
+            received = self._socket.recv_into(self._view[self._end:])
+            if not received:
+                return self._on_eof(self._end)
+            self._end += received
+
+        ret = bytes(self._view[:size])
+        self._start = size
+        return ret
+
+    def _read_big(self, size):
+        ret = bytearray(self._view[self._start:self._end])
+        self._start, self._end = 0, 0
+        while len(ret) < size:
+            chunk = self._view[:min(size - len(ret), len(self._buffer))]
+            received = self._socket.recv_into(chunk)
+            if not received:
+                return self._on_eof(len(ret))
+            ret += chunk[:received]
+        return ret
+
+    @staticmethod
+    def _on_eof(received):
+        if received:
+            raise ConnectionError("Connection closed in the middle of frame")
+        return None
+
+
+def _check_length(length, max_frame_size):
+    if length > max_frame_size:
+        raise ConnectionError(f"Frame is too big: {length} bytes")
+
+
+async def read_frame(reader, max_frame_size=MAX_FRAME_SIZE):
+    """Receive payload of next frame from asyncio stream.
+
+    Behaves like FramedSocket.recv.
+    """
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except IncompleteReadError as error:
+        if error.partial:
+            raise ConnectionError("Connection closed in the middle of frame")
+        return None
+    length, = HEADER.unpack(header)
+    _check_length(length, max_frame_size)
+    try:
+        return await reader.readexactly(length)
+    except IncompleteReadError:
+        raise ConnectionError("Connection closed in the middle of frame")
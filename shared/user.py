@@ -2,7 +2,12 @@
 
 
 class User:
-    """User contains information about user."""
+    """User contains information about user.
+
+    Users are created by thousands, so they have no __dict__.
+    """
+
+    __slots__ = ("_name", "_credits", "_items")
 
     def __init__(self, name):
         """Create new user."""
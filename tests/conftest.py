@@ -0,0 +1,51 @@
+"""Fixtures, shared by tests.
+
+Modules of project are imported by bare name, like in its executables,
+so directories with them are added into path.
+"""
+
+import sys
+from os.path import dirname, join
+from sqlite3 import connect
+import pytest
+
+ROOT = dirname(dirname(__file__))
+for directory in ("shared", "server/src", "client/src"):
+    sys.path.insert(0, join(ROOT, directory))
+
+from item_sqlite_db import ItemsDB  # noqa: E402
+from user_sqlite_db import UsersDB  # noqa: E402
+from persister import Persister  # noqa: E402
+from servercore import ServerCore  # noqa: E402
+
+
+@pytest.fixture
+def databases(tmp_path):
+    """Get paths to data bases of items and users, filled from server/data."""
+    paths = []
+    for name in ("items", "users"):
+        path = str(tmp_path/f"{name}.db")
+        with open(join(ROOT, "server", "data", f"{name}.sql")) as script:
+            connection = connect(path)
+            connection.executescript(script.read())
+            connection.commit()
+            connection.close()
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def server_core(databases):
+    """Get ServerCore, which compresses messages of at least 64 bytes."""
+    items_path, users_path = databases
+    users_db = UsersDB(users_path)
+    persister = Persister(users_db, 100, 1)
+    return ServerCore(
+        ItemsDB(items_path),
+        users_db,
+        1,
+        100,
+        persister,
+        False,
+        compression_threshold=64
+    )
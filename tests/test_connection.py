@@ -0,0 +1,48 @@
+"""Tests of server-side Connection."""
+
+from zlib import decompress
+import pytest
+from codec import DEFAULT_CODEC
+from compression import COMPRESSION, CompressedCodec
+from connection import Connection
+from request import Request
+
+
+def _negotiate_compression(connection):
+    """Switch connection to compression and get client-side codec."""
+    response = DEFAULT_CODEC.decode_response(connection.process(
+        DEFAULT_CODEC.encode_request(Request(
+            Request.Type.PING,
+            {"codecs": [DEFAULT_CODEC.name], "compression": [COMPRESSION]}
+        ))
+    ))
+    assert response.data["compression"] == COMPRESSION
+    return CompressedCodec(
+        DEFAULT_CODEC,
+        0,
+        decompress(response.data["zdict"])
+    )
+
+
+def test_compressed_request_within_frame_size(server_core):
+    connection = Connection(server_core, max_frame_size=64*1024)
+    codec = _negotiate_compression(connection)
+
+    payload = codec.encode_request(Request(Request.Type.GET_ITEM, "hat"))
+    response = codec.decode_response(connection.process(payload))
+
+    assert response.success
+    assert response.data.name == "hat"
+
+
+def test_decompressed_request_bigger_than_frame_size(server_core):
+    connection = Connection(server_core, max_frame_size=64*1024)
+    codec = _negotiate_compression(connection)
+
+    payload = codec.encode_request(
+        Request(Request.Type.GET_ITEM, "a"*1024*1024)
+    )
+    assert len(payload) < 64*1024
+
+    with pytest.raises(ValueError, match="too big"):
+        connection.process(payload)
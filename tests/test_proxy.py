@@ -0,0 +1,70 @@
+"""Tests of client-side Proxy against real server."""
+
+from sqlite3 import connect
+from threading import Thread
+from time import monotonic
+import pytest
+from clienthandler import ClientHandler
+from proxy import Proxy
+from request import Request
+from serverhandler import ServerHandler
+
+
+@pytest.fixture
+def port(server_core):
+    """Get port of server, which serves clients with server_core."""
+    client_handler = ClientHandler(0, server_core)
+    Thread(target=client_handler.serve_forever, daemon=True).start()
+    yield client_handler.server_address[1]
+    client_handler.shutdown()
+    client_handler.server_close()
+
+
+def _change_items(server_core, items_path, statement):
+    connection = connect(items_path)
+    connection.execute(statement)
+    connection.commit()
+    connection.close()
+    server_core.reload_items()
+
+
+def _item_exists(proxy, item_name, expected, timeout=5):
+    """Wait until Proxy gets notification, which makes item exist or not."""
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        if proxy.execute(Request.Type.ITEM_EXISTS, item_name).data == expected:
+            return True
+        proxy.execute(Request.Type.PING)
+    return False
+
+
+def test_item_added_by_notification_and_removed_offline(
+        server_core, databases, port):
+    items_path, _ = databases
+    proxy = Proxy(ServerHandler("127.0.0.1", port, 5))
+    proxy.reconnect()
+
+    _change_items(server_core, items_path,
+                  "INSERT INTO items VALUES ('sword', 50, 25)")
+    assert _item_exists(proxy, "sword", True)
+
+    # Notification about removal is lost, since client reconnects.
+    _change_items(server_core, items_path,
+                  "DELETE FROM items WHERE name == 'sword'")
+    proxy.reconnect()
+
+    assert not proxy.execute(Request.Type.ITEM_EXISTS, "sword").data
+    assert "sword" not in proxy.execute(Request.Type.GET_ALL_ITEMS_NAMES).data
+
+
+def test_catalogue_is_synced_by_digest_without_notifications(
+        server_core, databases, port):
+    items_path, _ = databases
+    proxy = Proxy(ServerHandler("127.0.0.1", port, 5))
+    proxy.reconnect()
+
+    _change_items(server_core, items_path,
+                  "DELETE FROM items WHERE name == 'hat'")
+    proxy.reconnect()
+
+    assert not proxy.execute(Request.Type.ITEM_EXISTS, "hat").data